@@ -7,12 +7,43 @@
 from __future__ import annotations
 
 import argparse
+import codecs
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import io
+import json
+import locale
+import mmap
 import os
+import queue
 import re
+import select
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
 import webbrowser
-from datetime import datetime
+import zlib
+from array import array
+from collections import Counter, defaultdict, deque
+from collections.abc import Sequence
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from datetime import datetime, timedelta
+from itertools import accumulate, chain
 from pathlib import Path
-from typing import NamedTuple
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
 
 
 class ScanProps(NamedTuple):
@@ -23,6 +54,8 @@ class ScanProps(NamedTuple):
 class FileInfo(NamedTuple):
     last_modified: str
     full_name: str
+    size: int = 0
+    mtime_ns: int = 0
 
 
 class TodoItem(NamedTuple):
@@ -30,25 +63,182 @@ class TodoItem(NamedTuple):
     is_elevated: bool
     item_text: str
     source_file: str
+    tags: tuple[str, ...] = ()
+
+
+#  A tag is a word starting with '#' and at least one more character, where
+#  words are separated by spaces, tabs, line breaks, commas, periods, and
+#  parentheses. Other whitespace only ends a word at either end of the text,
+#  which is removed by tag_text() first.
+tag_regex = re.compile(r"(?<![^ \t\n,.()])#[^ \t\n,.()]+")
+
+
+def tag_text(text):
+    """Return text without the whitespace and separators at either end."""
+    start = 0
+    end = len(text)
+    while start < end and (text[start].isspace() or text[start] in ",.()"):
+        start += 1
+    while end > start and (text[end - 1].isspace() or text[end - 1] in ",.()"):
+        end -= 1
+    return text[start:end]
+
+
+#  Bits in FileItems.flags.
+item_flagged = 1
+item_elevated = 2
+
+
+class FileItems(Sequence):
+    """The to-do items read from one file, stored compactly."""
+
+    __slots__ = ("ends", "file_name", "flags", "tags", "text")
+
+    def __init__(self, file_name, flags=b"", texts=()):
+        self.file_name = sys.intern(file_name)
+        self.flags = bytes(flags)
+        self.text = "".join(texts)
+        self.ends = array("q", accumulate(map(len, texts)))
+        self.tags = {}
+        for index, text in enumerate(texts):
+            if "#" in text:
+                found = tag_regex.findall(tag_text(text))
+                if found:
+                    self.tags[index] = tuple(map(sys.intern, found))
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self.ends)
+        if not 0 <= index < len(self.ends):
+            raise IndexError("item index out of range")
+        start = self.ends[index - 1] if index else 0
+        flags = self.flags[index]
+        return TodoItem(
+            bool(flags & item_flagged),
+            bool(flags & item_elevated),
+            self.text[start : self.ends[index]],
+            self.file_name,
+            self.tags.get(index, ()),
+        )
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self.ends)))
+
+    def __eq__(self, other):
+        if isinstance(other, FileItems):
+            return (
+                self.file_name == other.file_name
+                and self.flags == other.flags
+                and self.ends == other.ends
+                and self.text == other.text
+            )
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "FileItems({0!r}, {1} items)".format(self.file_name, len(self))
+
+
+class ItemRefs(Sequence):
+    """A list of references to items held in FileItems."""
+
+    __slots__ = ("indexes", "sources")
+
+    def __init__(self):
+        self.sources = []
+        self.indexes = array("q")
+
+    def append(self, file_items: FileItems, index: int):
+        self.sources.append(file_items)
+        self.indexes.append(index)
+
+    def clear(self):
+        self.sources.clear()
+        del self.indexes[:]
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self.sources[index][self.indexes[index]]
+
+    def __iter__(self):
+        return map(FileItems.__getitem__, self.sources, self.indexes)
+
+    def refs(self):
+        """Return an iterator of (FileItems, index) pairs."""
+        return zip(self.sources, self.indexes)
+
+    def __eq__(self, other):
+        if isinstance(other, (ItemRefs, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
 
 
 class TodoFile(NamedTuple):
     last_modified: str
     full_name: str
-    todo_items: list[TodoItem]
+    todo_items: FileItems
+
+
+class ReportPage(NamedTuple):
+    file_name: str
+    label: str
+    todo_files: list[TodoFile]
+
+
+class ItemQuery(NamedTuple):
+    words: list[str]
+    tags: list[str]
+    flagged: bool
+    path: str
+    since: str
+    limit: int
 
 
 class AppOptions(NamedTuple):
     folders: list[str]
     optfile: str
     recurse: bool
+    no_ignore_files: bool
     by_mtime: bool
     output_file: str
     do_text: bool
     do_text_dt: bool
     no_html: bool
+    skip_unchanged: bool
+    compact: bool
+    minify: bool
+    split_output: bool
+    split_files: int
+    virtual: bool
+    search: bool
     page_title: str
     no_browser: bool
+    scan_workers: int
+    cache_dir: str | None
+    rebuild_cache: bool
+    watch: bool
+    poll_interval: float | None
+    parse_workers: int
+    pipeline_workers: int
+    spool: bool
+    db_file: str | None
+    changes_file: str | None
+    save_snapshot: str | None
+    from_snapshot: str | None
 
 
 #  Using calver (YYYY.0M.MICRO) for applications.
@@ -63,6 +253,15 @@ css_mode = 2
 # 1 = embed from external css file (use to get css to update embed_style).
 # 2 = embed from function embed_style.
 
+#  In compact HTML output the item text is only shown in the main section,
+#  and the flagged and tags sections link to it. Set by main() from the
+#  --compact option.
+compact_html = False
+
+#  Maximum length of the item summary linked from the flagged and tags
+#  sections in compact HTML output.
+compact_summary_len = 60
+
 debug_stop_after_args = False
 
 default_file_specs = [
@@ -75,6 +274,42 @@ default_file_specs = [
     "^Context-.*.txt$",
 ]
 
+#  Folders that are skipped (pruned) when scanning, unless the options file
+#  has a [prune] section.
+default_prune_dirs = [
+    ".git",
+    ".hg",
+    ".svn",
+    ".venv",
+    "venv",
+    ".tox",
+    ".nox",
+    "node_modules",
+    "__pycache__",
+    ".mypy_cache",
+    ".pytest_cache",
+    ".ruff_cache",
+    "build",
+    "dist",
+]
+
+#  Most files waiting to be read when using --pipeline.
+pipeline_queue_size = 1000
+
+#  Most files in a batch sent to a worker process when using --parse-workers.
+parse_batch_max_files = 256
+
+#  Files, in the scanned folders, with .gitignore-style rules for files and
+#  folders to skip.
+ignore_file_names = (".gitignore", ".todolisterignore")
+
+#  Set from the --no-ignore-files option in main().
+use_ignore_files = True
+
+#  Buffer size, in bytes, for writing the output files, which are written
+#  in many small pieces.
+output_buffer_size = 1024 * 1024
+
 css_file_name = str(Path.cwd() / "style.css")
 
 default_output_file = str(Path.cwd() / "from-todolister.html")
@@ -86,132 +321,1033 @@ dirs_to_scan: list[ScanProps] = []
 dirs_to_exclude: list[str] = []
 file_list: list[FileInfo] = []
 ignore_list: list[str] = []
+prune_list: list[str] = []
 error_messages: list[str] = []
 todo_files: list[TodoFile] = []
-flagged_items: list[str] = []
-item_tags = {}
-
+flagged_items = ItemRefs()
+item_tags: dict[str, ItemRefs] = {}
+files_skipped = 0
+unchanged_outputs: list[str] = []
+
+#  Name of the page holding each file's part of the main section, keyed on
+#  the file path, when the HTML output is split into pages. Empty when the
+#  report is a single page.
+page_names: dict[str, str] = {}
+
+
+#  Characters that have a special meaning in a regular expression, used when
+#  looking for a literal prefix or suffix in a file spec.
+regex_special_chars = set("\\.^$*+?{}[]|()")
+
+
+def spec_literal_prefix(spec):
+    """Return the literal text a file name must start with, or None."""
+    if not spec.startswith("^") or "|" in spec or "(?" in spec:
+        return None
+    n = 1
+    while n < len(spec) and spec[n] not in regex_special_chars:
+        n += 1
+    prefix = spec[1:n]
+    #  A quantifier makes the last literal character optional or repeated.
+    if n < len(spec) and spec[n] in "*+?{":
+        prefix = prefix[:-1]
+    return prefix or None
+
+
+def spec_literal_suffix(spec):
+    """Return the literal text a file name must end with, or None."""
+    if not spec.endswith("$") or spec.endswith("\\$") or "|" in spec or "(?" in spec:
+        return None
+    n = len(spec) - 1
+    while n > 0 and spec[n - 1] not in regex_special_chars:
+        n -= 1
+    suffix = spec[n:-1]
+    #  An escaped first character is a character class, such as '\d'.
+    if n > 0 and spec[n - 1] == "\\":
+        suffix = suffix[1:]
+    return suffix or None
+
+
+class FileMatcher:
+    """The file specs compiled into a single regular expression."""
+
+    __slots__ = ("is_compiled", "prefixes", "regex", "suffixes", "use_prefilter")
+
+    def __init__(self):
+        self.is_compiled = False
+        self.regex = None
+        self.prefixes = ()
+        self.suffixes = ()
+        self.use_prefilter = False
+
+    def compile(self, specs):
+        """Compile the specs. Bad specs are reported once, and skipped."""
+        patterns = []
+        prefixes = []
+        suffixes = []
+        use_prefilter = True
+        for spec in specs:
+            pattern = spec.lower()
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                msg = "ERROR bad match spec '{0}'. Error message: '{1}'".format(
+                    pattern, e
+                )
+                print(msg)
+                if msg not in error_messages:
+                    error_messages.append(msg)
+                continue
+
+            patterns.append(pattern)
+
+            prefix = spec_literal_prefix(pattern)
+            if prefix:
+                prefixes.append(prefix)
+                continue
+            suffix = spec_literal_suffix(pattern)
+            if suffix:
+                suffixes.append(suffix)
+                continue
+            use_prefilter = False
 
-def matches_filespec(file_name):
-    for spec in file_specs:
         try:
-            if re.search(spec.lower(), file_name.lower()):
-                return True
-        except Exception as e:  # noqa: PERF203
-            msg = "ERROR bad match spec '{0}'. Error message: '{1}'".format(
-                spec.lower(), e
+            regex = re.compile(
+                "|".join("(?:{0})".format(p) for p in patterns), re.IGNORECASE
             )
-            print(msg)
-            if msg not in error_messages:
-                error_messages.append(msg)
+        except re.error:
+            #  Some specs, such as ones using group references, cannot be
+            #  combined. Fall back to checking the specs one at a time.
+            regex = [re.compile(p, re.IGNORECASE) for p in patterns]
+
+        self.regex = regex if patterns else None
+        self.prefixes = tuple(prefixes)
+        self.suffixes = tuple(suffixes)
+        self.use_prefilter = use_prefilter
+        self.is_compiled = True
+
+    def matches(self, file_name):
+        if self.regex is None:
+            return False
+        if self.use_prefilter:
+            name = file_name.lower()
+            if not (name.startswith(self.prefixes) or name.endswith(self.suffixes)):
+                return False
+        if isinstance(self.regex, list):
+            return any(r.search(file_name) for r in self.regex)
+        return self.regex.search(file_name) is not None
+
+
+file_matcher = FileMatcher()
+
+
+def matches_filespec(file_name):
+    if not file_matcher.is_compiled:
+        file_matcher.compile(file_specs)
+    return file_matcher.matches(file_name)
+
+
+def glob_part_regex(part, escapes=False):
+    """Translate one part of a glob-style pattern into a regex."""
+    result = []
+    i = 0
+    n = len(part)
+    while i < n:
+        c = part[i]
+        i += 1
+        if escapes and c == "\\" and i < n:
+            result.append(re.escape(part[i]))
+            i += 1
+        elif c == "*":
+            result.append("[^/]*")
+        elif c == "?":
+            result.append("[^/]")
+        elif c == "[":
+            j = i
+            if j < n and part[j] == "!":
+                j += 1
+            if j < n and part[j] == "]":
+                j += 1
+            j = part.find("]", j)
+            if j < 0:
+                result.append(re.escape(c))
+            else:
+                chars = part[i:j].replace("\\", "\\\\")
+                if chars.startswith("!"):
+                    #  A negated class does not match the separator either.
+                    chars = "^/" + chars[1:].replace("]", "\\]", 1)
+                elif chars.startswith("^"):
+                    chars = "\\" + chars
+                result.append("[{0}]".format(chars))
+                i = j + 1
+        else:
+            result.append(re.escape(c))
+    return "".join(result)
+
+
+def glob_match_regex(pattern):
+    """Return a regex that works like PurePath.match for the pattern."""
+    parts = pattern.strip("/").split("/")
+    body = "/".join(glob_part_regex(part) for part in parts)
+    if pattern.startswith("/"):
+        return "^/{0}$".format(body)
+    return "(?:^|/){0}$".format(body)
+
+
+def glob_full_match_regex(pattern):
+    """Return a regex that works like PurePath.full_match, or None."""
+    if not pattern.startswith(("/", "**")):
+        return None
+    parts = pattern.rstrip("/").split("/")
+    result = ["^"]
+    last = len(parts) - 1
+    for i, part in enumerate(parts):
+        if part == "**":
+            result.append(".*" if i == last else "(?:[^/]*/)*")
+        else:
+            result.append(glob_part_regex(part))
+            if i < last:
+                result.append("/")
+    result.append("$")
+    return "".join(result)
+
+
+class ScanFilter:
+    """The [exclude] and [ignore] lists compiled for use while scanning."""
+
+    __slots__ = (
+        "dir_names",
+        "exclude_paths",
+        "file_regex",
+        "is_compiled",
+        "prune_names",
+        "tree_regex",
+    )
+
+    def __init__(self):
+        self.is_compiled = False
+        self.exclude_paths = frozenset()
+        self.dir_names = frozenset()
+        self.prune_names = frozenset()
+        self.file_regex = None
+        self.tree_regex = None
+
+    def compile(self, exclude_paths, ignore_patterns, prune_names=()):
+        dir_names = set()
+        file_regexes = []
+        tree_regexes = []
+        for pattern in ignore_patterns:
+            #  A 'directory/' pattern matches a single path part at any level.
+            if "*" not in pattern and pattern.endswith(os.sep):
+                dir_names.add(pattern.rstrip(os.sep))
+
+            glob = pattern.replace(os.sep, "/")
+            if not glob.strip("/"):
+                continue
+
+            #  Look for a simple match that may use wildcard patterns.
+            file_regexes.append(glob_match_regex(glob))
+
+            #  Look for a full match that may use glob-style patterns.
+            full_regex = glob_full_match_regex(glob)
+            if full_regex:
+                file_regexes.append(full_regex)
+
+            #  A 'directory/**' pattern matches everything below the directory.
+            if glob.endswith("/**") and glob[:-3].strip("/"):
+                tree_regexes.append(glob_match_regex(glob[:-3]))
+
+        flags = re.IGNORECASE if os.name == "nt" else 0
+        self.exclude_paths = frozenset(exclude_paths)
+        self.dir_names = frozenset(dir_names)
+        self.prune_names = frozenset(prune_names)
+        self.file_regex = (
+            re.compile("|".join(file_regexes), flags) if file_regexes else None
+        )
+        self.tree_regex = (
+            re.compile("|".join(tree_regexes), flags) if tree_regexes else None
+        )
+        self.is_compiled = True
+
+    def excludes_dir(self, dir_name):
+        return dir_name in self.exclude_paths
+
+    def ignores_dir(self, dir_name):
+        """Check if a directory, and everything below it, is ignored."""
+        p = Path(dir_name)
+        if p.name in self.dir_names:
+            return True
+        return self.tree_regex is not None and bool(
+            self.tree_regex.search(p.as_posix())
+        )
+
+    def prunes_dir(self, dir_name):
+        return Path(dir_name).name in self.prune_names
+
+    def ignores_parents(self, dir_name):
+        """Check if any of the directories containing dir_name are ignored."""
+        return any(self.ignores_dir(str(p)) for p in Path(dir_name).parents)
+
+    def ignores_file(self, file_name):
+        if not self.dir_names and self.file_regex is None:
+            return False
+        p = Path(file_name)
+        if not self.dir_names.isdisjoint(p.parts):
+            return True
+        return self.file_regex is not None and bool(
+            self.file_regex.search(p.as_posix())
+        )
+
+
+scan_filter = ScanFilter()
 
-    return False
+
+def get_scan_filter():
+    if not scan_filter.is_compiled:
+        scan_filter.compile(dirs_to_exclude, ignore_list, prune_list)
+    return scan_filter
 
 
 def exclude_dir(dir_name):
-    # TODO: Is simple string match good enough?
-    return any(dir_name == xdir for xdir in dirs_to_exclude)
+    return get_scan_filter().excludes_dir(dir_name)
+
+
+def ignore_dir(dir_name):
+    return get_scan_filter().ignores_dir(dir_name)
 
 
 def to_ignore(p: Path) -> bool:
     """Check if the file path matches a pattern in the ignore list."""
-    for pattern in ignore_list:
-        #  Look for a 'directory/' match for a single path part at any level.
-        if (
-            "*" not in pattern
-            and pattern.endswith(os.sep)
-            and pattern.rstrip(os.sep) in p.parts
-        ):
-            return True
-        #  Look for a simple match that may use wildcard patterns.
-        if p.match(pattern):
-            return True
-        #  Look for a full match that may use glob-style patterns.
-        if p.full_match(pattern):
-            return True
-    return False
+    return get_scan_filter().ignores_file(str(p))
 
 
-def get_matching_files(dir_name, do_recurse):
-    p = Path(dir_name).resolve()
+class IgnoreRule(NamedTuple):
+    base: str
+    regex: re.Pattern
+    negate: bool
+    dir_only: bool
 
-    if exclude_dir(str(p)):
-        print("  Exclude [{0}]".format(str(p)))
-        return
 
+def ignore_file_regex(pattern, anchored):
+    """Translate a .gitignore-style pattern into a regex."""
+    parts = pattern.split("/")
+    last = len(parts) - 1
+    result = []
+    for i, part in enumerate(parts):
+        if part == "**":
+            result.append(".*" if i == last else "(?:[^/]+/)*")
+        else:
+            result.append(glob_part_regex(part, escapes=True))
+            if i < last:
+                result.append("/")
+    return "{0}{1}$".format("^" if anchored else "(?:^|/)", "".join(result))
+
+
+def read_ignore_file(dir_name, file_name) -> list[IgnoreRule]:
+    """Read the rules from a .gitignore-style file in dir_name."""
+    rules = []
+    base = Path(dir_name).as_posix().rstrip("/") + "/"
+    flags = re.IGNORECASE if os.name == "nt" else 0
     try:
-        for f in [x for x in p.iterdir() if x.is_file()]:
-            if matches_filespec(f.name) and not to_ignore(f):
-                ts = datetime.fromtimestamp(f.stat().st_mtime)
-                file_list.append(FileInfo(ts.strftime("%Y-%m-%d %H:%M"), str(f)))
+        with (Path(dir_name) / file_name).open(errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError as e:
+        print("Cannot read [{0}]: {1}".format(Path(dir_name) / file_name, e))
+        return rules
+
+    for line in lines:
+        if not line or line.startswith("#"):
+            continue
+        pattern = line if line.endswith("\\ ") else line.rstrip(" ")
+        negate = pattern.startswith("!")
+        #  A leading backslash escapes a literal '!' or '#'.
+        if negate or pattern.startswith("\\"):
+            pattern = pattern[1:]
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        if not pattern:
+            continue
+        #  A pattern with a separator is relative to the ignore file's
+        #  directory. Otherwise it matches a name at any level below it.
+        anchored = "/" in pattern
+        regex = re.compile(ignore_file_regex(pattern.lstrip("/"), anchored), flags)
+        rules.append(IgnoreRule(base, regex, negate, dir_only))
+    return rules
+
+
+def ignored_by_rules(rules, path, is_dir) -> bool:
+    """Check a path against the rules from the ignore files above it."""
+    if not rules:
+        return False
+    posix_path = Path(path).as_posix()
+    result = False
+    for rule in rules:
+        if rule.dir_only and not is_dir:
+            continue
+        if not posix_path.startswith(rule.base):
+            continue
+        if rule.regex.search(posix_path[len(rule.base) :]):
+            result = not rule.negate
+    return result
+
+
+def child_ignore_rules(dir_name, ignore_files, rules) -> tuple[IgnoreRule, ...]:
+    """Add the rules from any ignore files in dir_name to the inherited rules."""
+    if not use_ignore_files:
+        return rules
+    for file_name in ignore_file_names:
+        if file_name in ignore_files:
+            rules = (*rules, *read_ignore_file(dir_name, file_name))
+    return rules
+
+
+def ignore_files_in(dir_name):
+    return [n for n in ignore_file_names if (Path(dir_name) / n).is_file()]
+
+
+def inherited_ignore_rules(dir_name) -> tuple[IgnoreRule, ...]:
+    """Get the rules from the ignore files in the directories above dir_name."""
+    rules = ()
+    scan_prop = scan_root_for(dir_name)
+    if scan_prop is None or not use_ignore_files:
+        return rules
+    d = Path(scan_prop.dir_name)
+    p = Path(dir_name)
+    if p == d:
+        return rules
+    rules = child_ignore_rules(str(d), ignore_files_in(d), rules)
+    for part in p.relative_to(d).parts[:-1]:
+        d = d / part
+        rules = child_ignore_rules(str(d), ignore_files_in(d), rules)
+    return rules
+
+
+def skip_dir(dir_name, rules, is_root=False):
+    """Check if a directory is excluded, ignored, or pruned."""
+    if exclude_dir(dir_name) or ignore_dir(dir_name):
+        return True
+    if is_root:
+        return False
+    return scan_filter.prunes_dir(dir_name) or ignored_by_rules(rules, dir_name, True)
+
+
+class DirScan(NamedTuple):
+    files: list[FileInfo]
+    subdirs: list[str]
+    ignore_files: tuple[str, ...] = ()
+
+
+def file_info_from_stat(file_name, st):
+    ts = datetime.fromtimestamp(st.st_mtime)
+    return FileInfo(
+        ts.strftime("%Y-%m-%d %H:%M"),
+        sys.intern(file_name),
+        st.st_size,
+        st.st_mtime_ns,
+    )
+
+
+def list_dir(dir_name: str) -> DirScan:
+    """List a single directory, returning the matching files and sub-directories."""
+    files = []
+    subdirs = []
+    ignore_files = []
+    with os.scandir(dir_name) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.is_file():
+                if entry.name in ignore_file_names:
+                    ignore_files.append(entry.name)
+                if matches_filespec(entry.name):
+                    files.append(file_info_from_stat(entry.path, entry.stat()))
+    return DirScan(files, subdirs, tuple(ignore_files))
+
+
+class DirCache:
+    """On-disk cache of directory listings, checked against their modified time."""
+
+    __slots__ = (
+        "dirty",
+        "entries",
+        "file_name",
+        "hits",
+        "lock",
+        "misses",
+        "racy_ns",
+        "seen",
+    )
+
+    version = 4
+
+    #  Directories modified this close to the start of the scan are not
+    #  cached, as a later change within the same timestamp tick would not be
+    #  seen.
+    racy_seconds = 2
+
+    def __init__(self):
+        self.file_name = None
+        self.entries = {}
+        self.seen = set()
+        self.hits = 0
+        self.misses = 0
+        self.racy_ns = 0
+        self.lock = threading.Lock()
+        self.dirty = True
+
+    def load(self, file_name, specs, rebuild=False):
+        self.file_name = file_name
+        self.racy_ns = time.time_ns() - self.racy_seconds * 1_000_000_000
+        p = Path(file_name)
+        if rebuild or not p.exists():
+            return
+        try:
+            with p.open(encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print("Cannot read cache file [{0}]: {1}".format(file_name, e))
+            return
+        if data.get("version") == self.version and data.get("specs") == specs:
+            self.entries = data.get("dirs", {})
+            self.dirty = False
+
+    def scan(self, dir_name: str) -> DirScan:
+        """List the directory, or reuse the cached listing if unchanged."""
+        st = Path(dir_name).stat()
+        entry = self.entries.get(dir_name)
+        if entry is not None and entry[0] == st.st_mtime_ns:
+            #  Join the names the same way as os.scandir does, and use
+            #  os.stat, to avoid the cost of a Path object for each file.
+            base = dir_name if dir_name.endswith(os.sep) else dir_name + os.sep
+            files = []
+            for name in entry[1]:
+                try:
+                    f_st = os.stat(base + name)  # noqa: PTH116
+                except FileNotFoundError:
+                    continue
+                files.append(file_info_from_stat(base + name, f_st))
+            subdirs = [base + name for name in entry[2]]
+            with self.lock:
+                self.seen.add(dir_name)
+                self.hits += 1
+            return DirScan(files, subdirs, tuple(entry[3]))
+
+        dir_scan = list_dir(dir_name)
+        with self.lock:
+            self.seen.add(dir_name)
+            self.misses += 1
+            self.dirty = True
+            if st.st_mtime_ns < self.racy_ns:
+                self.entries[dir_name] = [
+                    st.st_mtime_ns,
+                    [Path(f.full_name).name for f in dir_scan.files],
+                    [Path(d).name for d in dir_scan.subdirs],
+                    list(dir_scan.ignore_files),
+                ]
+            else:
+                self.entries.pop(dir_name, None)
+        return dir_scan
+
+    def save(self, specs):
+        if self.file_name is None:
+            return
+        for name in [n for n in self.entries if n not in self.seen]:
+            if not Path(name).exists():
+                del self.entries[name]
+                self.dirty = True
+        if self.dirty:
+            write_json_atomic(
+                self.file_name,
+                {"version": self.version, "specs": specs, "dirs": self.entries},
+            )
+            self.dirty = False
+
+    def summary(self):
+        return "Directory cache: {0} hits, {1} misses.".format(self.hits, self.misses)
+
+
+dir_cache = DirCache()
+
+
+def scan_dir(dir_name: str) -> DirScan:
+    """List a single directory, using the directory cache when enabled."""
+    if dir_cache.file_name is None:
+        return list_dir(dir_name)
+    return dir_cache.scan(dir_name)
+
+
+def walk_dirs(
+    dir_name, do_recurse, scan: Callable[[str], DirScan] = scan_dir
+) -> Iterator[tuple[str, list[FileInfo]]]:
+    """Walk the directory tree, yielding each directory and its matching files."""
+    root = str(Path(dir_name).resolve())
+    if get_scan_filter().ignores_parents(root):
+        return
+
+    stack = [(root, inherited_ignore_rules(root))]
+    while stack:
+        path, rules = stack.pop()
+
+        if exclude_dir(path):
+            print("  Exclude [{0}]".format(path))
+            continue
+
+        if skip_dir(path, rules, path == root):
+            continue
+
+        label = dir_name if path == root else path
+        try:
+            dir_scan = scan(path)
+        except FileNotFoundError:
+            msg = "ERROR (FileNotFoundError): Cannot scan directory {0}".format(label)
+            print(msg)
+            error_messages.append(msg)
+            continue
+        except PermissionError:
+            msg = "ERROR (PermissionError): Cannot scan directory {0}".format(label)
+            print(msg)
+            error_messages.append(msg)
+            continue
+
+        rules = child_ignore_rules(path, dir_scan.ignore_files, rules)
+
+        yield (
+            path,
+            [
+                f
+                for f in dir_scan.files
+                if not (
+                    scan_filter.ignores_file(f.full_name)
+                    or ignored_by_rules(rules, f.full_name, False)
+                )
+            ],
+        )
 
         if do_recurse:
-            for d in [x for x in p.iterdir() if x.is_dir() and not x.is_symlink()]:
-                get_matching_files(d, do_recurse)
+            #  Push in reverse so sub-directories are visited in listing order.
+            stack.extend((sub, rules) for sub in reversed(dir_scan.subdirs))
 
-    except FileNotFoundError:
-        msg = "ERROR (FileNotFoundError): Cannot scan directory {0}".format(dir_name)
-        print(msg)
-        error_messages.append(msg)
 
-    except PermissionError:
-        msg = "ERROR (PermissionError): Cannot scan directory {0}".format(dir_name)
-        print(msg)
-        error_messages.append(msg)
+def walk_matching_files(
+    dir_name, do_recurse, scan: Callable[[str], DirScan] = scan_dir
+) -> Iterator[FileInfo]:
+    """Walk the directory tree, yielding a FileInfo for each matching file."""
+    for _, files in walk_dirs(dir_name, do_recurse, scan):
+        yield from files
 
 
-def get_todo_items(file_name):
-    todo_items = []
-    try:
-        with Path(file_name).open(errors="replace") as text_file:
-            in_todo = False
-            todo_text = ""
-            is_flagged = False
-            is_elevated = False
-            lines = text_file.readlines()
-            for line_raw in lines:
-                line_trim = line_raw.strip()
-                if in_todo:
-                    if not line_trim:
-                        in_todo = False
-                        if todo_text:
-                            todo_items.append(
-                                TodoItem(
-                                    is_flagged,
-                                    is_elevated,
-                                    todo_text,
-                                    file_name,
+def get_matching_files(dir_name, do_recurse):
+    file_list.extend(walk_matching_files(dir_name, do_recurse))
+
+
+def prefetch_dir_scans(
+    scan_props: list[ScanProps],
+    workers: int,
+    listed: Callable[[list[FileInfo]], None] | None = None,
+):
+    """Scan the directory trees for all of the folders on a thread pool."""
+    results: dict[str, DirScan | OSError] = {}
+    descend: dict[str, bool] = {}
+    child_rules: dict[str, tuple[IgnoreRule, ...]] = {}
+    pending = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+
+        def visit(path, do_recurse, rules, is_root=False):
+            if skip_dir(path, rules, is_root):
+                return
+            if path in descend:
+                #  Already listed, or being listed. A folder may also be
+                #  reached from a folder with a recursive scan, so make sure
+                #  its sub-directories are scanned in that case.
+                if do_recurse and not descend[path]:
+                    descend[path] = True
+                    result = results.get(path)
+                    if isinstance(result, DirScan):
+                        for sub in result.subdirs:
+                            visit(sub, True, child_rules[path])
+                return
+            descend[path] = do_recurse
+            pending[pool.submit(scan_dir, path)] = (path, rules)
+
+        for scan_prop in scan_props:
+            root = str(Path(scan_prop.dir_name).resolve())
+            if not get_scan_filter().ignores_parents(root):
+                visit(root, scan_prop.do_recurse, (), is_root=True)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, rules = pending.pop(future)
+                try:
+                    result = future.result()
+                except (FileNotFoundError, PermissionError) as e:
+                    results[path] = e
+                    continue
+                results[path] = result
+                child_rules[path] = child_ignore_rules(path, result.ignore_files, rules)
+                if listed is not None:
+                    listed(
+                        [
+                            f
+                            for f in result.files
+                            if not (
+                                scan_filter.ignores_file(f.full_name)
+                                or ignored_by_rules(
+                                    child_rules[path], f.full_name, False
                                 )
                             )
-                            todo_text = ""
-                            is_flagged = False
-                            is_elevated = False
-                    else:
-                        todo_text += line_raw
-
-                #  Markdown list-item to-dos (- [ ]) are included, but flagged and
-                #  elevated modifiers are not applied to them.
-                elif line_trim.startswith("[ ]") or line_trim.startswith("- [ ]"):
-                    in_todo = True
-                    is_flagged = line_trim.startswith("[ ]*")
-                    is_elevated = line_trim.startswith("[ ]+")
-                    todo_text += line_raw
-
-            #  Save last item, in case there were no blank lines at the
-            #  end of the file.
-            if todo_text:
-                todo_items.append(
-                    TodoItem(is_flagged, is_elevated, todo_text, file_name)
-                )
+                        ]
+                    )
+                if descend[path]:
+                    for sub in result.subdirs:
+                        visit(sub, True, child_rules[path])
+
+    return results
+
+
+def get_matching_files_parallel(scan_props: list[ScanProps], workers: int):
+    """Scan the given folders using a pool of worker threads."""
+    file_list.extend(walk_matching_files_parallel(scan_props, workers))
+
+
+def walk_matching_files_parallel(
+    scan_props: list[ScanProps],
+    workers: int,
+    listed: Callable[[list[FileInfo]], None] | None = None,
+) -> Iterator[FileInfo]:
+    results = prefetch_dir_scans(scan_props, workers, listed)
+
+    def scan_done(path):
+        result = results[path]
+        if isinstance(result, OSError):
+            raise result
+        return result
+
+    for scan_prop in scan_props:
+        print("Scanning folder [{0}]".format(scan_prop.dir_name))
+        yield from walk_matching_files(
+            scan_prop.dir_name, scan_prop.do_recurse, scan_done
+        )
+
+
+def parse_todo_lines(lines, file_name):
+    """Collect the to-do items from an iterable of lines."""
+    texts = []
+    flags = bytearray()
+    in_todo = False
+    item_lines = []
+    item_flags = 0
+    for line_raw in lines:
+        line_trim = line_raw.strip()
+        if in_todo:
+            if not line_trim:
+                in_todo = False
+                if item_lines:
+                    texts.append("".join(item_lines))
+                    flags.append(item_flags)
+                    item_lines = []
+                    item_flags = 0
+            else:
+                item_lines.append(line_raw)
+
+        #  Markdown list-item to-dos (- [ ]) are included, but flagged and
+        #  elevated modifiers are not applied to them.
+        elif line_trim.startswith("[ ]") or line_trim.startswith("- [ ]"):
+            in_todo = True
+            if line_trim.startswith("[ ]*"):
+                item_flags = item_flagged
+            elif line_trim.startswith("[ ]+"):
+                item_flags = item_elevated
+            item_lines.append(line_raw)
+
+    #  Save last item, in case there were no blank lines at the
+    #  end of the file.
+    if item_lines:
+        texts.append("".join(item_lines))
+        flags.append(item_flags)
+
+    return FileItems(file_name, flags, texts)
+
+
+#  Encoding used to read the to-do files (the default for open()).
+text_encoding = locale.getpreferredencoding(False)
+
+#  The bytes that start every to-do item line, or None if '[ ]' and the line
+#  endings are not plain ASCII bytes in text_encoding (such as UTF-16), in
+#  which case every file is decoded in full.
+todo_marker_bytes = b"[ ]" if "[ ]\r\n".encode(text_encoding) == b"[ ]\r\n" else None
+
+#  Characters, other than line endings, that str.strip() removes and that
+#  are single ASCII bytes.
+ascii_space_bytes = b" \t\x0b\x0c\x1c\x1d\x1e\x1f"
+
+#  Bytes read at a time when looking for the first to-do marker in a file.
+marker_scan_chunk_size = 1 << 16
+
+
+def first_marker_line(data) -> int:
+    """Return the offset of the first line that may start an item, or -1."""
+    pos = data.find(todo_marker_bytes)
+    while pos >= 0:
+        line_start = max(data.rfind(b"\n", 0, pos), data.rfind(b"\r", 0, pos)) + 1
+        prefix = data[line_start:pos]
+        if prefix.strip(ascii_space_bytes) in (b"", b"-") or not prefix.isascii():
+            return line_start
+        pos = data.find(todo_marker_bytes, pos + len(todo_marker_bytes))
+    return -1
+
+
+def first_marker_offset(binary_file) -> int:
+    """Return the file offset of the first line that may start an item, or -1."""
+    offset = 0
+    data = b""
+    while chunk := binary_file.read(marker_scan_chunk_size):
+        data += chunk
+        start = first_marker_line(data)
+        if start >= 0:
+            return offset + start
+        #  Keep the last, unfinished, line, as a marker may be split across
+        #  chunks. A very long line is given to the parser instead.
+        line_start = max(data.rfind(b"\n"), data.rfind(b"\r")) + 1
+        if len(data) - line_start > marker_scan_chunk_size:
+            return offset + line_start
+        offset += line_start
+        data = data[line_start:]
+    return -1
+
+
+def open_marked_text(binary_file):
+    """Return a text stream from the first line that may start an item, or None."""
+    if todo_marker_bytes is not None:
+        start = first_marker_offset(binary_file)
+        if start < 0:
+            return None
+        binary_file.seek(start)
+    return io.TextIOWrapper(binary_file, encoding=text_encoding, errors="replace")
+
+
+def read_todo_items(file_name):
+    """Read the to-do items from a file, returning (items, error message)."""
+    try:
+        with Path(file_name).open("rb") as binary_file:
+            text_file = open_marked_text(binary_file)
+            if text_file is None:
+                return None, None
+            return parse_todo_lines(text_file, file_name), None
 
     except PermissionError:
         msg = "ERROR (PermissionError): Cannot read {0}".format(file_name)
+        return FileItems(file_name, [item_flagged | item_elevated], [msg]), msg
+
+
+def get_todo_items(file_name):
+    todo_items, msg = read_todo_items(file_name)
+    if msg:
+        print(msg)
+        error_messages.append(msg)
+    return todo_items or []
+
+
+def accept_read_result(file_info: FileInfo, items, msg):
+    """Handle the result of read_todo_items for a file not in the cache."""
+    global files_skipped  # noqa: PLW0603
+    if msg:
         print(msg)
         error_messages.append(msg)
-        todo_items.append(TodoItem(True, True, msg, file_name))
+    else:
+        parse_cache.put(file_info, items)
+    if items is None:
+        files_skipped += 1
+        items = FileItems(file_info.full_name)
+    return items
+
+
+# ---------------------------------------------------------------------
+#  region -- Parse cache:
+
+
+class ParseCache:
+    """On-disk cache of the to-do items read from each file."""
+
+    __slots__ = ("dirty", "entries", "evicted", "file_name", "hits", "misses", "seen")
+
+    version = 2
+
+    def __init__(self):
+        self.file_name = None
+        self.entries = {}
+        self.seen = set()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.dirty = True
+
+    def load(self, file_name, rebuild=False):
+        """Enable the cache, using the given cache file."""
+        self.file_name = file_name
+        p = Path(file_name)
+        if rebuild or not p.exists():
+            return
+        try:
+            with p.open(encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print("Cannot read cache file [{0}]: {1}".format(file_name, e))
+            return
+        if data.get("version") == self.version:
+            self.entries = data.get("files", {})
+            self.dirty = False
+
+    def get(self, file_info: FileInfo) -> FileItems | None:
+        global files_skipped  # noqa: PLW0603
+        if self.file_name is None:
+            return None
+        self.seen.add(file_info.full_name)
+        entry = self.entries.get(file_info.full_name)
+        if (
+            entry is None
+            or entry[0] != file_info.size
+            or entry[1] != file_info.mtime_ns
+        ):
+            self.misses += 1
+            return None
+        self.hits += 1
+        if entry[2] is None:
+            #  The file has no to-do markers.
+            files_skipped += 1
+            return FileItems(file_info.full_name)
+        return FileItems(
+            file_info.full_name,
+            [
+                flagged * item_flagged | elevated * item_elevated
+                for flagged, elevated, _ in entry[2]
+            ],
+            [text for _, _, text in entry[2]],
+        )
+
+    def put(self, file_info: FileInfo, items: FileItems | None):
+        if self.file_name is None:
+            return
+        self.dirty = True
+        self.entries[file_info.full_name] = [
+            file_info.size,
+            file_info.mtime_ns,
+            None
+            if items is None
+            else [[int(i.is_flagged), int(i.is_elevated), i.item_text] for i in items],
+        ]
+
+    def save(self):
+        """Write the cache file, if anything changed."""
+        if self.file_name is None:
+            return
+        for name in [n for n in self.entries if n not in self.seen]:
+            if not Path(name).exists():
+                del self.entries[name]
+                self.evicted += 1
+                self.dirty = True
+        if self.dirty:
+            write_json_atomic(
+                self.file_name, {"version": self.version, "files": self.entries}
+            )
+            self.dirty = False
+
+    def summary(self):
+        return "Parse cache: {0} hits, {1} misses, {2} evicted.".format(
+            self.hits, self.misses, self.evicted
+        )
+
+
+parse_cache = ParseCache()
+
+
+def write_json_atomic(file_name, data):
+    """Write data as JSON to a temporary file that then replaces file_name."""
+    p = Path(file_name)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + ".tmp")
+    #  json.dumps uses the C encoder, unlike json.dump to a file.
+    text = json.dumps(data, separators=(",", ":"))
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(text)
+    tmp.replace(p)
+
+
+def read_todo_items_batch(file_names):
+    """Read a batch of files in a worker process."""
+    return [read_todo_items(file_name) for file_name in file_names]
+
+
+def parse_batches(file_infos: list[FileInfo], workers: int):
+    """Split the files into batches for the worker processes."""
+    by_size = sorted(file_infos, key=lambda f: f.size, reverse=True)
+    target_bytes = max(sum(f.size for f in by_size) // (workers * 8), 1)
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for f in by_size:
+        batch.append(f.full_name)
+        batch_bytes += f.size
+        if batch_bytes >= target_bytes or len(batch) >= parse_batch_max_files:
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def parse_in_processes(file_infos: list[FileInfo], workers: int):
+    """Read the files on a pool of worker processes."""
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        batches = parse_batches(file_infos, workers)
+        for batch, batch_results in zip(
+            batches, pool.map(read_todo_items_batch, batches)
+        ):
+            results.update(zip(batch, batch_results))
+    return results
+
+
+def read_todo_files(parse_workers=0):
+    """Read the to-do items from each file in file_list into todo_files."""
+    if parse_workers > 1:
+        cached = {}
+        to_read = []
+        for file_info in file_list:
+            items = parse_cache.get(file_info)
+            if items is None:
+                to_read.append(file_info)
+            else:
+                cached[file_info.full_name] = items
+
+        results = parse_in_processes(to_read, parse_workers) if to_read else {}
+
+        for file_info in file_list:
+            items = cached.get(file_info.full_name)
+            if items is None:
+                print("Reading file [{0}]".format(file_info.full_name))
+                items = accept_read_result(file_info, *results[file_info.full_name])
+            todo_files.append(
+                TodoFile(file_info.last_modified, file_info.full_name, items)
+            )
+        return
+
+    for file_info in file_list:
+        items = read_todo_file(file_info)
+        todo_files.append(TodoFile(file_info.last_modified, file_info.full_name, items))
+
+
+def read_todo_file(file_info: FileInfo):
+    items = parse_cache.get(file_info)
+    if items is None:
+        print("Reading file [{0}]".format(file_info.full_name))
+        items = accept_read_result(file_info, *read_todo_items(file_info.full_name))
+    return items
 
-    return todo_items
 
+#  endregion
 
 # ---------------------------------------------------------------------
 #  region -- CSS styling in output:
@@ -280,11 +1416,11 @@ def embed_style():
         .item0 {background-color: #F5F5F5;}
         .item1 {background-color: #FFF;}
         .flagged {font-weight: bold;}
-        #flagged_section, #tags_section, #contents_section {
+        #flagged_section, #tags_section, #contents_section, #changes_section {
             border-top: 2px solid #999;
             margin-bottom: 30px;
         }
-        #flagged_items a, #tagged_items a, #contents_section a {
+        #flagged_items a, #tagged_items a, #contents_section a, #changes_items a {
             font-family: monospace;
             font-size: large;
             color: navy;
@@ -376,10 +1512,37 @@ def html_text(text):
     return s.replace("\n", "<br />")
 
 
+def item_anchor(file_name, index):
+    return "{0}:{1}".format(as_link_name(file_name), index + 1)
+
+
+def file_href(file_name):
+    return "{0}#{1}".format(page_names.get(file_name, ""), as_link_name(file_name))
+
+
+def item_href(file_name, index):
+    return "{0}#{1}".format(
+        page_names.get(file_name, ""), item_anchor(file_name, index)
+    )
+
+
+def item_summary(text):
+    """Return the first line of an item's text, shortened."""
+    s = text.strip().split("\n", 1)[0].strip()
+    if len(s) > compact_summary_len:
+        s = s[: compact_summary_len - 3].rstrip() + "..."
+    return s
+
+
 def todo_item_html(item, row):
     add_class = " flagged" if item.is_flagged or item.is_elevated else ""
 
-    s = '<div class="item{0}{1}">\n'.format(row % 2, add_class)
+    if compact_html:
+        s = '<div class="item{0}{1}" id="{2}">\n'.format(
+            row % 2, add_class, item_anchor(item.source_file, row - 1)
+        )
+    else:
+        s = '<div class="item{0}{1}">\n'.format(row % 2, add_class)
 
     s += '<div class="itemtext">\n{0}\n</div>\n'.format(html_text(item.item_text))
 
@@ -391,124 +1554,177 @@ def as_link_name(file_name):
     return file_name.strip(" /\\").replace(" ", "_").replace("/", "-").replace(".", "-")
 
 
-def contents_section(todo_files, any_flags, any_tags):
+def contents_link_html(file_name):
+    return '<li class="flink"><a href="{0}">{1}</a></li>{2}'.format(
+        file_href(file_name), file_name, "\n"
+    )
+
+
+def contents_section_parts(
+    any_flags, any_tags, links, main_links=None, any_changes=False
+):
+    """Yield the contents section, given the rendered links to each file."""
     s = '<div id="contents_section">\n'
     s += "<h2>Contents</h2>\n"
 
     s += "<h3>Sections</h3>\n"
     s += "<ul>\n"
 
+    if any_changes:
+        s += '<li><a href="#changes_section">Changes Since Last Run</a></li>\n'
+
     if any_flags:
         s += '<li><a href="#flagged_section">Flagged Items</a></li>\n'
 
     if any_tags:
         s += '<li><a href="#tags_section">Tagged Items</a></li>\n'
 
-    s += '<li><a href="#main">Files with To-do Items</a></li>\n'
+    if main_links is None:
+        s += '<li><a href="#main">Files with To-do Items</a></li>\n'
+    else:
+        for href, label in main_links:
+            s += '<li><a href="{0}">{1}</a></li>\n'.format(href, label)
 
     s += "</ul>\n"
 
     s += "<h3>Files</h3>\n"
     s += "<ul>\n"
+    yield s
 
-    for todo_file in todo_files:
-        if todo_file.todo_items:
-            s += '<li class="flink"><a href="#{0}">{1}</a></li>{2}'.format(
-                as_link_name(todo_file.full_name), todo_file.full_name, "\n"
-            )
+    yield from links
 
-    s += "</ul>\n"
-    s += "</div>  <!--end contents_section -->\n"
-    return s
+    yield "</ul>\n"
+    yield "</div>  <!--end contents_section -->\n"
 
 
-def flagged_item_html(item, row):
-    s = '<div class="flag{0}">\n'.format(row % 2)
+def contents_section(todo_files, any_flags, any_tags, main_links=None):
+    return contents_section_parts(
+        any_flags,
+        any_tags,
+        (contents_link_html(f.full_name) for f in todo_files if f.todo_items),
+        main_links,
+        item_changes.last_run is not None,
+    )
+
 
-    s += '<p class="flink"><a href="#{0}">{1}</a></p>\n'.format(
-        as_link_name(item.source_file), item.source_file
+def item_ref_html(item, index):
+    """The HTML for an item in the flagged or tags section."""
+    s = '<p class="flink"><a href="{0}">{1}</a></p>\n'.format(
+        file_href(item.source_file), item.source_file
     )
 
-    s += '<div class="itemtext">\n{0}\n</div>\n'.format(html_text(item.item_text))
+    if compact_html:
+        s += '<div class="itemtext"><a href="{0}">{1}</a></div>\n'.format(
+            item_href(item.source_file, index),
+            html_text(item_summary(item.item_text)),
+        )
+    else:
+        s += '<div class="itemtext">\n{0}\n</div>\n'.format(html_text(item.item_text))
 
     s += "</div>\n"
     return s
 
 
-def flagged_items_html(items):
-    if not items:
-        return ""
+def flagged_item_html(item, index, row):
+    return '<div class="flag{0}">\n'.format(row % 2) + item_ref_html(item, index)
 
+
+def flagged_section_parts(rows):
     s = '<div id="flagged_section">\n'
     s += "<h2><a>Flagged Items</a></h2>\n"
     s += '<div id="flagged_items">\n'
-    for item in items:
-        s += item
-    s += "</div>  <!--end flagged_items -->\n"
-    s += "</div>  <!--end flagged_section -->\n"
-    return s
+    yield s
+    yield from rows
+    yield "</div>  <!--end flagged_items -->\n"
+    yield "</div>  <!--end flagged_section -->\n"
+
+
+def flagged_items_html(items: ItemRefs):
+    if not items:
+        return ()
+    return flagged_section_parts(
+        '<div class="flag{0}">\n'.format(row % 2)
+        + fragment_cache.item_html(file_items, index)
+        for row, (file_items, index) in enumerate(items.refs(), start=1)
+    )
 
 
 def get_flagged_items():
-    row = 0
     for todo_file in todo_files:
-        for item in todo_file.todo_items:
-            if item.is_flagged:
-                row += 1
-                flagged_items.append(flagged_item_html(item, row))
+        items = todo_file.todo_items
+        for index, flags in enumerate(items.flags):
+            if flags & item_flagged:
+                flagged_items.append(items, index)
 
 
-def tagged_item_html(item, row):
-    s = '<div class="tag{0}">\n'.format(row % 2)
+def tagged_item_html(item, index, row):
+    return '<div class="tag{0}">\n'.format(row % 2) + item_ref_html(item, index)
 
-    s += '<p class="flink"><a href="#{0}">{1}</a></p>{2}'.format(
-        as_link_name(item.source_file), item.source_file, "\n"
-    )
 
-    s += '<div class="itemtext">\n{0}\n</div>\n'.format(html_text(item.item_text))
+def tags_section_parts(tag_groups):
+    """Yield the tags section, given (tag, rendered rows) pairs."""
+    s = '<div id="tags_section">\n'
+    s += "<h2><a>Tagged Items</a></h2>\n"
+    s += '<div id="tagged_items">\n'
+    yield s
 
-    s += "</div>\n"
-    return s
+    for tag, rows in tag_groups:
+        s = '<div class="tagheader">\n'
+        s += "<p>Tag: <strong>{0}</strong></p>\n".format(tag)
+        s += "</div>\n"
+        yield s
+
+        yield from rows
+
+    yield "</div>  <!--end tagged_items -->\n"
+    yield "</div>  <!--end tags_section -->\n"
+
+
+def tag_rows(items: ItemRefs):
+    for row, (file_items, index) in enumerate(items.refs(), start=1):
+        yield '<div class="tag{0}">\n'.format(row % 2) + fragment_cache.item_html(
+            file_items, index
+        )
 
 
 def tags_section(todo_tags):
     if not todo_tags:
-        return ""
+        return ()
+    return tags_section_parts(
+        (tag, tag_rows(items)) for tag, items in sorted(todo_tags.items())
+    )
 
-    s = '<div id="tags_section">\n'
-    s += "<h2><a>Tagged Items</a></h2>\n"
-    s += '<div id="tagged_items">\n'
 
-    for tag, items in sorted(todo_tags.items()):
-        s += '<div class="tagheader">\n'
-        s += "<p>Tag: <strong>{0}</strong></p>\n".format(tag)
-        s += "</div>\n"
+def todo_file_parts(todo_file: TodoFile):
+    """Yield the main section fragment for one file with to-do items."""
+    s = todo_file_html(todo_file.full_name, todo_file.last_modified)
+    s += '<div class="filecontent">\n'
+    yield s
 
-        for row, item in enumerate(items, start=1):
-            s += tagged_item_html(item, row)
+    for row, item in enumerate(todo_file.todo_items, start=1):
+        yield "{0}\n".format(todo_item_html(item, row))
 
-    s += "</div>  <!--end tagged_items -->\n"
-    s += "</div>  <!--end tags_section -->\n"
-    return s
+    s = '<p class="toplink">'
+    s += '(<a href="#contents_section">top</a>)</p>\n'
 
+    s += "</div>  <!--end filecontent -->\n\n"
+    yield s
 
-def main_section(todo_files):
-    s = '<div id="main">\n'
-    s += "<h2><a>Files with To-do Items</a></h2>\n"
-    for todo_file in todo_files:
-        if todo_file.todo_items:
-            s += todo_file_html(todo_file.full_name, todo_file.last_modified)
-            s += '<div class="filecontent">\n'
 
-            for row, item in enumerate(todo_file.todo_items, start=1):
-                s += "{0}\n".format(todo_item_html(item, row))
+def main_section_parts(file_parts):
+    yield '<div id="main">\n'
+    yield "<h2><a>Files with To-do Items</a></h2>\n"
+    yield from file_parts
+    yield "</div>  <!--end main -->\n"
 
-            s += '<p class="toplink">'
-            s += '(<a href="#contents_section">top</a>)</p>\n'
 
-            s += "</div>  <!--end filecontent -->\n\n"
-    s += "</div>  <!--end main -->\n"
-    return s
+def main_section(todo_files):
+    return main_section_parts(
+        part
+        for f in todo_files
+        if f.todo_items
+        for part in fragment_cache.file_parts(f)
+    )
 
 
 def settings_section(by_mtime: bool):
@@ -618,6 +1834,27 @@ def getopt_no_html(default_no_html, opt_content):
     return opt_is_true(value, "Skip creating HTML file output (y/N)?")
 
 
+def getopt_skip_unchanged(default_skip_unchanged, opt_content):
+    value = get_option_value("[output]", "skip_unchanged", opt_content)
+    if value is None:
+        return default_skip_unchanged
+    return opt_is_true(value, "Skip writing output files that have not changed (y/N)?")
+
+
+def getopt_compact(default_compact, opt_content):
+    value = get_option_value("[output]", "compact", opt_content)
+    if value is None:
+        return default_compact
+    return opt_is_true(value, "Show the text of each item only once (y/N)?")
+
+
+def getopt_minify(default_minify, opt_content):
+    value = get_option_value("[output]", "minify", opt_content)
+    if value is None:
+        return default_minify
+    return opt_is_true(value, "Remove line breaks and indentation from HTML (y/N)?")
+
+
 def getopt_title(default_title, opt_content):
     value = get_option_value("[output]", "title", opt_content)
     if value is None:
@@ -625,6 +1862,15 @@ def getopt_title(default_title, opt_content):
     return value
 
 
+def getopt_cache_dir(default_cache_dir, opt_content):
+    if default_cache_dir is not None:
+        return str(Path(default_cache_dir).expanduser().resolve())
+    value = get_option_value("[cache]", "dir", opt_content)
+    if value is None:
+        return None
+    return str(Path(value).expanduser().resolve())
+
+
 def getopt_filespecs(opt_content):
     entries = get_option_entries("[match]", opt_content)
     if entries:
@@ -661,6 +1907,18 @@ def getopt_ignore(opt_content):
     ignore_list.extend([entry.strip("'\" ") for entry in entries])
 
 
+def getopt_prune(no_prune, opt_content):
+    if no_prune:
+        return
+    entries = get_option_entries("[prune]", opt_content)
+    if entries:
+        #  If the options file contains a prune list then it overrides the
+        #  defaults.
+        prune_list.extend([entry.strip("'\" /\\") for entry in entries])
+    else:
+        prune_list.extend(default_prune_dirs)
+
+
 def get_output_filename(args_filename, date_time, desired_suffix):
     p = Path(args_filename).expanduser().resolve()
 
@@ -685,108 +1943,2207 @@ def get_output_filename(args_filename, date_time, desired_suffix):
     return s
 
 
-def get_html_output(page_title: str, by_mtime: bool):
-    s = "{0}\n".format(html_head(page_title))
-    s += '<div id="wrapper">\n'
-    s += '<div id="content">\n'
-    s += "<h1>{0}</h1>\n".format(page_title)
+class RunTime(str):
+    """The run date and time, as shown in the output."""
 
-    s += "{0}\n".format(
-        contents_section(todo_files, bool(flagged_items), bool(item_tags))
-    )
+    __slots__ = ()
 
-    s += "{0}\n".format(flagged_items_html(flagged_items))
 
-    s += "{0}\n".format(tags_section(item_tags))
+def output_fingerprint(parts) -> str:
+    """Return a hash of the output parts, leaving out the run date and time."""
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, RunTime):
+            h.update(part.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
 
-    s += "{0}\n".format(main_section(todo_files))
 
-    s += "{0}\n".format(settings_section(by_mtime))
+#  Line breaks and indentation between tags, and the comments marking the
+#  end of sections. Item text has no line breaks (they are <br /> tags or
+#  escaped in JSON), the report has no preformatted text, and the script in
+#  the virtual report is written to work without them, so removing these
+#  does not change how the page is shown.
+html_layout_regex = re.compile(r"\s*\n\s*|\s*<!--end [a-z_]+ -->")
 
-    s += '<div id="footer">\n'
-    s += "Created {0} by {1}.\n".format(run_dt.strftime("%Y-%m-%d %H:%M"), app_title)
 
-    s += "</div>\n\n"
-    s += "</div>  <!--end content -->\n"
-    s += "</div>  <!--end wrapper -->\n"
-    s += html_tail()
-    return s
+def minify_parts(parts):
+    """Yield the HTML output parts with the layout whitespace removed."""
+    for part in parts:
+        if isinstance(part, RunTime):
+            yield part
+        else:
+            yield html_layout_regex.sub("", part)
 
 
-def write_html_output(opts: AppOptions):
-    out_file_name = get_output_filename(opts.output_file, None, ".html")
-    print("\nWriting file [{0}].".format(out_file_name))
-    with Path(out_file_name).open("w") as f:
-        f.write(get_html_output(opts.page_title, opts.by_mtime))
+def fingerprint_file_name(out_file_name):
+    p = Path(out_file_name)
+    return str(p.with_name(".{0}.fingerprint".format(p.name)))
+
+
+def read_fingerprint_file(fingerprint_name, out_file_name):
+    """Return the fingerprint and output file name saved in a fingerprint file."""
+    fp = Path(fingerprint_name)
+    if not fp.exists():
+        return None, out_file_name
+    lines = fp.read_text().splitlines()
+    if len(lines) > 1:
+        return lines[0].strip(), lines[1]
+    return (lines[0].strip() if lines else None), out_file_name
+
+
+def write_output_file(out_file_name, make_parts, skip_unchanged, fingerprint_name):
+    """Write an output file from the parts returned by make_parts()."""
+    if skip_unchanged:
+        fingerprint = output_fingerprint(make_parts())
+        last_fingerprint, last_file_name = read_fingerprint_file(
+            fingerprint_name, out_file_name
+        )
+        if last_fingerprint == fingerprint and Path(last_file_name).exists():
+            print("\nOutput file [{0}] unchanged.".format(last_file_name))
+            return False
+
+    print("\nWriting file [{0}].".format(out_file_name))
+    p = Path(out_file_name)
+    tmp = p.with_name(p.name + ".tmp")
+    with tmp.open("w", buffering=output_buffer_size) as f:
+        f.writelines(make_parts())
+    tmp.replace(p)
+
+    if skip_unchanged:
+        Path(fingerprint_name).write_text(
+            "{0}\n{1}\n".format(fingerprint, out_file_name)
+        )
+    return True
+
+
+def html_page_parts(page_title: str, by_mtime: bool, sections):
+    """Yield the HTML page in fragments."""
+    s = "{0}\n".format(html_head(page_title))
+    s += '<div id="wrapper">\n'
+    s += '<div id="content">\n'
+    s += "<h1>{0}</h1>\n".format(page_title)
+    yield s
+
+    for section in sections:
+        yield from section
+        yield "\n"
+
+    yield "{0}\n".format(settings_section(by_mtime))
+
+    yield '<div id="footer">\nCreated '
+    yield RunTime(run_dt.strftime("%Y-%m-%d %H:%M"))
+
+    s = " by {0}.\n".format(app_title)
+    s += "</div>\n\n"
+    s += "</div>  <!--end content -->\n"
+    s += "</div>  <!--end wrapper -->\n"
+    s += html_tail()
+    yield s
+
+
+def html_output_parts(page_title: str, by_mtime: bool):
+    return html_page_parts(
+        page_title,
+        by_mtime,
+        [
+            contents_section(todo_files, bool(flagged_items), bool(item_tags)),
+            *changes_sections(),
+            flagged_items_html(flagged_items),
+            tags_section(item_tags),
+            main_section(todo_files),
+        ],
+    )
+
+
+def get_html_output(page_title: str, by_mtime: bool):
+    return "".join(html_output_parts(page_title, by_mtime))
+
+
+def write_html_output(opts: AppOptions, spool: ReportSpool | None = None):
+    out_file_name = get_output_filename(opts.output_file, None, ".html")
+
+    def make_parts():
+        if opts.virtual:
+            parts = virtual_html_parts(opts.page_title, opts.by_mtime, opts.search)
+        elif spool is None:
+            parts = html_output_parts(opts.page_title, opts.by_mtime)
+        else:
+            parts = spool.html_parts(opts.page_title, opts.by_mtime)
+        return minify_parts(parts) if opts.minify else parts
+
+    if not write_output_file(
+        out_file_name,
+        make_parts,
+        opts.skip_unchanged,
+        fingerprint_file_name(out_file_name),
+    ):
+        unchanged_outputs.append(out_file_name)
+
+
+def todo_file_text(todo_file: TodoFile):
+    """Yield the text report fragment for one file with to-do items."""
+    s = "-" * 70 + "\n"
+    s += todo_file.full_name + "\n"
+    s += "  ({0})\n\n".format(todo_file.last_modified)
+    yield s
+    for item in todo_file.todo_items:
+        yield item.item_text + "\n"
+    yield "\n"
+
+
+def text_report_parts(file_parts):
+    """Yield the text report in fragments."""
+    yield "Gathered ToDo Items\n"
+    yield from file_parts
+    yield "-" * 70 + "\nCreated "
+    yield RunTime(run_dt.strftime("%Y-%m-%d %H:%M"))
+    yield " by {0}.\n".format(app_title)
+
+
+def text_output_parts():
+    return text_report_parts(
+        chain(
+            changes_text(),
+            (part for f in todo_files if f.todo_items for part in todo_file_text(f)),
+        )
+    )
 
 
 def get_text_output():
-    sep = "-" * 70
-    text = "Gathered ToDo Items\n"
-    for todo_file in todo_files:
-        if todo_file.todo_items:
-            s = sep + "\n"
-            s += todo_file.full_name + "\n"
-            s += "  ({0})\n\n".format(todo_file.last_modified)
-            for item in todo_file.todo_items:
-                s += item.item_text + "\n"
-            s += "\n"
-            text += s
-    text += sep + "\n"
-    text += "Created {0} by {1}.\n".format(run_dt.strftime("%Y-%m-%d %H:%M"), app_title)
-    return text
-
-
-def write_text_output(opt):
+    return "".join(text_output_parts())
+
+
+def write_text_output(opt, spool: ReportSpool | None = None):
     if opt.do_text_dt:
         out_file_name = get_output_filename(opt.output_file, run_dt, ".txt")
     else:
         out_file_name = get_output_filename(opt.output_file, None, ".txt")
 
-    print("\nWriting file [{0}].".format(out_file_name))
+    def make_parts():
+        return text_output_parts() if spool is None else spool.text_parts()
 
-    with Path(out_file_name).open("w") as f:
-        f.write(get_text_output())
+    #  A file with the date_time in its name is compared with the last text
+    #  output written, whatever its name, and is not written if the last one
+    #  is unchanged and still exists.
+    fingerprint_name = fingerprint_file_name(
+        get_output_filename(opt.output_file, None, ".txt")
+    )
+    if not write_output_file(
+        out_file_name, make_parts, opt.skip_unchanged, fingerprint_name
+    ):
+        unchanged_outputs.append(
+            read_fingerprint_file(fingerprint_name, out_file_name)[1]
+        )
 
 
 def open_html_output(opt):
     if not (opt.no_browser or opt.no_html):
-        url = "file://{0}".format(get_output_filename(opt.output_file, None, ".html"))
+        out_file_name = get_output_filename(opt.output_file, None, ".html")
+        if out_file_name in unchanged_outputs:
+            return
+        url = "file://{0}".format(out_file_name)
         webbrowser.open(url)
 
 
 # ---------------------------------------------------------------------
+#  region -- Fragment cache:
 
 
-def prune(text):
-    if text is None:
-        return ""
-    s = text.replace("\t", " ")
-    s = s.replace("\n", " ")
-    s = s.replace(",", " ")
-    s = s.replace(".", " ")
-    s = s.replace("(", " ")
-    s = s.replace(")", " ")
-    s = s.strip()
-    #  Remove any repeating spaces.
-    while s.find("  ") >= 0:
-        s = s.replace("  ", " ")
-    return s
+def items_checksum(items: FileItems):
+    """Return a checksum of the items' text and flags."""
+    checksum = zlib.crc32(items.text.encode("utf-8", "surrogatepass"))
+    return zlib.crc32(items.flags, checksum)
+
+
+def fragment_key(todo_file: TodoFile):
+    """Return the values that a file's rendered HTML depends on."""
+    return [
+        todo_file.last_modified,
+        items_checksum(todo_file.todo_items),
+        compact_html,
+        page_names.get(todo_file.full_name, ""),
+    ]
+
+
+class FragmentCache:
+    """Cache of the rendered HTML for each file."""
+
+    __slots__ = (
+        "current",
+        "dirty",
+        "enabled",
+        "entries",
+        "file_name",
+        "hits",
+        "misses",
+    )
+
+    version = 1
+
+    def __init__(self):
+        self.enabled = False
+        self.file_name = None
+        self.entries = {}
+        self.current = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = True
+
+    def load(self, file_name, rebuild=False):
+        """Enable the cache, using the given cache file."""
+        self.enabled = True
+        self.file_name = file_name
+        p = Path(file_name)
+        if rebuild or not p.exists():
+            return
+        try:
+            with p.open(encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print("Cannot read cache file [{0}]: {1}".format(file_name, e))
+            return
+        if data.get("version") == self.version and data.get("app") == __version__:
+            self.entries = data.get("files", {})
+            self.dirty = False
+
+    def start(self, todo_files: list[TodoFile]):
+        """Discard the fragments of files that changed."""
+        self.current = {}
+        if not self.enabled:
+            return
+        for todo_file in todo_files:
+            if not todo_file.todo_items:
+                continue
+            key = fragment_key(todo_file)
+            entry = self.entries.get(todo_file.full_name)
+            if entry is None or entry[0] != key:
+                #  [key, main section HTML, {item index: item HTML}]
+                entry = [key, None, {}]
+                self.entries[todo_file.full_name] = entry
+                self.misses += 1
+                self.dirty = True
+            else:
+                self.hits += 1
+            self.current[todo_file.full_name] = entry
+
+    def file_parts(self, todo_file: TodoFile):
+        entry = self.current.get(todo_file.full_name)
+        if entry is None:
+            return todo_file_parts(todo_file)
+        if entry[1] is None:
+            entry[1] = "".join(todo_file_parts(todo_file))
+            self.dirty = True
+        return (entry[1],)
+
+    def item_html(self, file_items: FileItems, index: int):
+        entry = self.current.get(file_items.file_name)
+        if entry is None:
+            return item_ref_html(file_items[index], index)
+        #  Keys are strings, as they are in the cache file.
+        key = str(index)
+        html = entry[2].get(key)
+        if html is None:
+            html = entry[2][key] = item_ref_html(file_items[index], index)
+            self.dirty = True
+        return html
+
+    def save(self):
+        """Write the cache file, if anything changed."""
+        if self.file_name is None:
+            return
+        for name in [n for n in self.entries if n not in self.current]:
+            if not Path(name).exists():
+                del self.entries[name]
+                self.dirty = True
+        if self.dirty:
+            write_json_atomic(
+                self.file_name,
+                {"version": self.version, "app": __version__, "files": self.entries},
+            )
+            self.dirty = False
+
+    def summary(self):
+        return "Fragment cache: {0} hits, {1} misses.".format(self.hits, self.misses)
+
+
+fragment_cache = FragmentCache()
+
+
+#  endregion
+
+# ---------------------------------------------------------------------
+#  region -- Spooled report:
+
+
+class ReportSpool:
+    """The rendered sections of the report, written to temporary files."""
+
+    __slots__ = (
+        "contents",
+        "flagged",
+        "main",
+        "n_flagged",
+        "tag_refs",
+        "tagged",
+        "text",
+    )
+
+    #  Encoding of the temporary files. The error handler lets file names
+    #  that could not be decoded pass through unchanged.
+    encoding = "utf-8"
+    errors = "surrogateescape"
+
+    def __init__(self, do_text=False):
+        self.contents = self.new_file()
+        self.flagged = self.new_file()
+        self.main = self.new_file()
+        self.tagged = self.new_file()
+        self.text = self.new_file() if do_text else None
+        self.n_flagged = 0
+        self.tag_refs: dict[str, array] = {}
+
+    @staticmethod
+    def new_file():
+        #  Closed by close(), and deleted by the system when closed.
+        return tempfile.TemporaryFile()  # noqa: SIM115
+
+    def close(self):
+        for f in (self.contents, self.flagged, self.main, self.tagged, self.text):
+            if f is not None:
+                f.close()
+
+    def write(self, f, parts):
+        f.write("".join(parts).encode(self.encoding, self.errors))
+
+    def add(self, todo_file: TodoFile):
+        items = todo_file.todo_items
+        if not items:
+            return
+
+        self.write(self.contents, [contents_link_html(todo_file.full_name)])
+        self.write(self.main, todo_file_parts(todo_file))
+        if self.text is not None:
+            self.write(self.text, todo_file_text(todo_file))
+
+        for index, flags in enumerate(items.flags):
+            if flags & item_flagged:
+                self.n_flagged += 1
+                self.write(
+                    self.flagged,
+                    [flagged_item_html(items[index], index, self.n_flagged)],
+                )
+
+        for index, tags in items.tags.items():
+            item = items[index]
+            for tag in tags:
+                refs = self.tag_refs.get(tag)
+                if refs is None:
+                    refs = self.tag_refs[tag] = array("q")
+                data = tagged_item_html(item, index, len(refs) // 2 + 1).encode(
+                    self.encoding, self.errors
+                )
+                refs.append(self.tagged.tell())
+                refs.append(len(data))
+                self.tagged.write(data)
+
+    def read(self, f):
+        """Yield the text written to a temporary file, in chunks."""
+        f.seek(0)
+        decoder = codecs.getincrementaldecoder(self.encoding)(self.errors)
+        while chunk := f.read(output_buffer_size):
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+    def read_tagged(self, refs):
+        for i in range(0, len(refs), 2):
+            self.tagged.seek(refs[i])
+            yield self.tagged.read(refs[i + 1]).decode(self.encoding, self.errors)
+
+    def html_parts(self, page_title: str, by_mtime: bool):
+        sections = [
+            contents_section_parts(
+                self.n_flagged > 0, bool(self.tag_refs), self.read(self.contents)
+            ),
+            flagged_section_parts(self.read(self.flagged)) if self.n_flagged else (),
+            tags_section_parts(
+                (tag, self.read_tagged(self.tag_refs[tag]))
+                for tag in sorted(self.tag_refs)
+            )
+            if self.tag_refs
+            else (),
+            main_section_parts(self.read(self.main)),
+        ]
+        return html_page_parts(page_title, by_mtime, sections)
+
+    def text_parts(self):
+        return text_report_parts(self.read(self.text))
+
+
+def spool_todo_files(spool: ReportSpool):
+    """Read the files in file_list, adding their items to the spool."""
+    for file_info in file_list:
+        items = read_todo_file(file_info)
+        spool.add(TodoFile(file_info.last_modified, file_info.full_name, items))
+
+
+#  endregion
+
+# ---------------------------------------------------------------------
+#  region -- Split output:
+
+
+def scan_root_index(file_name):
+    """Return the index in dirs_to_scan of the folder a file was found in."""
+    found = 0
+    found_len = -1
+    for index, scan_prop in enumerate(dirs_to_scan):
+        dir_name = scan_prop.dir_name.rstrip(os.sep)
+        if len(dir_name) > found_len and file_name.startswith(dir_name + os.sep):
+            found = index
+            found_len = len(dir_name)
+    return found
+
+
+def split_pages(out_file_name, files_per_page):
+    """Assign the files with to-do items to the pages of the split output."""
+    p = Path(out_file_name)
+    files = [f for f in todo_files if f.todo_items]
+    groups: dict[int, list[TodoFile]] = {}
+    if files_per_page > 0:
+        for i in range(0, len(files), files_per_page):
+            groups[i // files_per_page + 1] = files[i : i + files_per_page]
+        labels = {n: "Page {0}".format(n) for n in groups}
+    else:
+        for f in files:
+            groups.setdefault(scan_root_index(f.full_name) + 1, []).append(f)
+        labels = {n: dirs_to_scan[n - 1].dir_name for n in groups}
+
+    pages = []
+    for n in sorted(groups):
+        page_file = p.with_name("{0}-{1}{2}".format(p.stem, n, p.suffix))
+        pages.append(ReportPage(str(page_file), labels[n], groups[n]))
+        for f in groups[n]:
+            page_names[f.full_name] = page_file.name
+    return pages
+
+
+def page_html_parts(page: ReportPage, index_name, page_title: str, by_mtime: bool):
+    return html_page_parts(
+        "{0} - {1}".format(page_title, page.label),
+        by_mtime,
+        [
+            contents_section_parts(
+                False,
+                False,
+                (contents_link_html(f.full_name) for f in page.todo_files),
+                [(index_name, "Index"), ("#main", "Files with To-do Items")],
+            ),
+            main_section(page.todo_files),
+        ],
+    )
+
+
+def index_html_parts(pages: list[ReportPage], page_title: str, by_mtime: bool):
+    main_links = [
+        (
+            Path(page.file_name).name,
+            "{0} ({1} {2})".format(
+                page.label,
+                len(page.todo_files),
+                "file" if len(page.todo_files) == 1 else "files",
+            ),
+        )
+        for page in pages
+    ]
+    return html_page_parts(
+        page_title,
+        by_mtime,
+        [
+            contents_section(
+                todo_files, bool(flagged_items), bool(item_tags), main_links
+            ),
+            *changes_sections(),
+            flagged_items_html(flagged_items),
+            tags_section(item_tags),
+        ],
+    )
+
+
+def remove_stale_pages(out_file_name, pages: list[ReportPage]):
+    """Remove pages written by an earlier run that had more pages."""
+    p = Path(out_file_name)
+    current = {Path(page.file_name).name for page in pages}
+    page_regex = re.compile(
+        "{0}-[0-9]+{1}".format(re.escape(p.stem), re.escape(p.suffix))
+    )
+    with os.scandir(p.parent) as entries:
+        stale = [
+            e.path
+            for e in entries
+            if e.name not in current and page_regex.fullmatch(e.name)
+        ]
+    for page_file in stale:
+        fp = Path(fingerprint_file_name(page_file))
+        if fp.exists():
+            print("\nRemoving page [{0}].".format(page_file))
+            Path(page_file).unlink()
+            fp.unlink()
+
+
+def write_split_html_output(opts: AppOptions, pages: list[ReportPage]):
+    """Write the main section to the pages, and the rest to an index page."""
+    out_file_name = get_output_filename(opts.output_file, None, ".html")
+    index_name = Path(out_file_name).name
+
+    n_written = 0
+    for page in pages:
+
+        def make_page_parts(page=page):
+            parts = page_html_parts(page, index_name, opts.page_title, opts.by_mtime)
+            return minify_parts(parts) if opts.minify else parts
+
+        if write_output_file(
+            page.file_name,
+            make_page_parts,
+            True,
+            fingerprint_file_name(page.file_name),
+        ):
+            n_written += 1
+
+    remove_stale_pages(out_file_name, pages)
+    print("\nWrote {0} of {1} pages.".format(n_written, len(pages)))
+
+    def make_parts():
+        parts = index_html_parts(pages, opts.page_title, opts.by_mtime)
+        return minify_parts(parts) if opts.minify else parts
+
+    if not write_output_file(
+        out_file_name,
+        make_parts,
+        opts.skip_unchanged,
+        fingerprint_file_name(out_file_name),
+    ):
+        unchanged_outputs.append(out_file_name)
+
+
+#  endregion
+
+# ---------------------------------------------------------------------
+#  region -- Item changes:
+
+
+def item_fingerprint(text):
+    """Return a hash of an item's text, ignoring changes in whitespace."""
+    s = " ".join(text.split()).encode("utf-8", "surrogatepass")
+    return hashlib.blake2b(s, digest_size=8).hexdigest()
+
+
+class ItemChanges:
+    """The items that are new, moved, or closed since the last run."""
+
+    __slots__ = (
+        "added",
+        "closed",
+        "compared",
+        "current",
+        "file_name",
+        "last_run",
+        "moved",
+        "moved_from",
+        "previous",
+    )
+
+    version = 1
+
+    def __init__(self):
+        self.file_name = None
+        self.last_run = None
+        self.previous = {}
+        self.current = {}
+        self.added = ItemRefs()
+        self.moved = ItemRefs()
+        self.moved_from = []
+        self.closed = []
+        self.compared = False
+
+    def load(self, file_name):
+        """Read the fingerprints saved by the last run, if any."""
+        self.file_name = file_name
+        p = Path(file_name)
+        if not p.exists():
+            return
+        try:
+            with p.open(encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print("Cannot read changes file [{0}]: {1}".format(file_name, e))
+            return
+        if data.get("version") == self.version:
+            self.previous = data.get("files", {})
+            self.last_run = data.get("created")
+
+    def compare(self, todo_files: list[TodoFile]):
+        """Find the items that are new, moved, or closed."""
+        self.added.clear()
+        self.moved.clear()
+        self.moved_from = []
+        self.closed = []
+        self.current = {}
+        self.compared = self.last_run is not None
+
+        remaining = Counter(
+            (name, h) for name, entries in self.previous.items() for h, _ in entries
+        )
+        unmatched = []
+        for todo_file in todo_files:
+            items = todo_file.todo_items
+            if not items:
+                continue
+            entries = []
+            start = 0
+            for index, end in enumerate(items.ends):
+                text = items.text[start:end]
+                start = end
+                h = item_fingerprint(text)
+                entries.append([h, item_summary(text)])
+                key = (todo_file.full_name, h)
+                if remaining[key]:
+                    remaining[key] -= 1
+                else:
+                    unmatched.append((items, index, h))
+            self.current[todo_file.full_name] = entries
+
+        #  Items of the last run not matched in the same file are closed,
+        #  unless the same text is now in another file.
+        gone = []
+        gone_by_hash = defaultdict(deque)
+        for name, entries in self.previous.items():
+            for h, summary in entries:
+                key = (name, h)
+                if remaining[key]:
+                    remaining[key] -= 1
+                    gone_by_hash[h].append(len(gone))
+                    gone.append((name, summary))
+
+        for items, index, h in unmatched:
+            found = gone_by_hash.get(h)
+            if found:
+                i = found.popleft()
+                self.moved.append(items, index)
+                self.moved_from.append(gone[i][0])
+                gone[i] = None
+            else:
+                self.added.append(items, index)
+
+        self.closed = [g for g in gone if g is not None]
+
+    def save(self):
+        """Save the fingerprints of the current items, for the next run."""
+        self.last_run = run_dt.strftime("%Y-%m-%d %H:%M")
+        write_json_atomic(
+            self.file_name,
+            {"version": self.version, "created": self.last_run, "files": self.current},
+        )
+        self.previous = self.current
+
+    def summary(self):
+        if not self.compared:
+            return "Changes: no earlier run to compare with [{0}].".format(
+                self.file_name
+            )
+        return "Changes since last run: {0} new, {1} moved, {2} closed.".format(
+            len(self.added), len(self.moved), len(self.closed)
+        )
+
+
+item_changes = ItemChanges()
+
+
+def changes_rows():
+    """Yield (heading, rows) for each kind of change that has any items."""
+
+    def new_rows():
+        for row, (file_items, index) in enumerate(item_changes.added.refs(), 1):
+            yield '<div class="tag{0}">\n'.format(row % 2) + fragment_cache.item_html(
+                file_items, index
+            )
+
+    def moved_rows():
+        refs = zip(item_changes.moved.refs(), item_changes.moved_from)
+        for row, ((file_items, index), from_name) in enumerate(refs, start=1):
+            s = '<div class="tag{0}">\n'.format(row % 2)
+            s += "<p>Moved from {0}</p>\n".format(from_name)
+            yield s + fragment_cache.item_html(file_items, index)
+
+    def closed_rows():
+        for row, (file_name, summary) in enumerate(item_changes.closed, start=1):
+            s = '<div class="tag{0}">\n'.format(row % 2)
+            s += '<p class="flink"><a>{0}</a></p>\n'.format(file_name)
+            s += '<div class="itemtext">{0}</div>\n'.format(html_text(summary))
+            s += "</div>\n"
+            yield s
+
+    if item_changes.added:
+        yield "New Items ({0})".format(len(item_changes.added)), new_rows()
+    if item_changes.moved:
+        yield "Moved Items ({0})".format(len(item_changes.moved)), moved_rows()
+    if item_changes.closed:
+        yield "Closed Items ({0})".format(len(item_changes.closed)), closed_rows()
+
+
+def changes_section_parts():
+    s = '<div id="changes_section">\n'
+    s += "<h2><a>Changes Since Last Run</a></h2>\n"
+    s += "<p>Compared with the run at "
+    yield s
+    yield RunTime(item_changes.last_run)
+    s = ".</p>\n"
+    s += '<div id="changes_items">\n'
+    yield s
+
+    any_rows = False
+    for heading, rows in changes_rows():
+        any_rows = True
+        s = '<div class="tagheader">\n'
+        s += "<p><strong>{0}</strong></p>\n".format(heading)
+        s += "</div>\n"
+        yield s
+        yield from rows
+
+    if not any_rows:
+        yield "<p>No changes.</p>\n"
 
+    yield "</div>  <!--end changes_items -->\n"
+    yield "</div>  <!--end changes_section -->\n"
+
+
+def changes_sections():
+    """Return a list with the changes section, if there was an earlier run."""
+    if item_changes.last_run is None:
+        return []
+    return [changes_section_parts()]
+
+
+def changes_text():
+    """Yield the changes for the text report."""
+    if item_changes.last_run is None:
+        return
+    yield "-" * 70 + "\nChanges since the run at "
+    yield RunTime(item_changes.last_run)
+    yield ":\n  {0} new, {1} moved, {2} closed.\n".format(
+        len(item_changes.added), len(item_changes.moved), len(item_changes.closed)
+    )
+
+    if item_changes.added:
+        yield "\nNew items:\n"
+        for item in item_changes.added:
+            yield "\n{0}\n{1}\n".format(item.source_file, item.item_text)
+
+    if item_changes.moved:
+        yield "\nMoved items:\n"
+        for item, from_name in zip(item_changes.moved, item_changes.moved_from):
+            yield "\n{0}\n  (moved from {1})\n{2}\n".format(
+                item.source_file, from_name, item.item_text
+            )
+
+    if item_changes.closed:
+        yield "\nClosed items:\n"
+        for file_name, summary in item_changes.closed:
+            yield "\n{0}\n{1}\n".format(file_name, summary)
+
+    yield "\n"
+
+
+#  endregion
+
+# ---------------------------------------------------------------------
+#  region -- Snapshot:
+
+
+class SnapshotItems(FileItems):
+    """FileItems loaded from a snapshot, reading the text when first used."""
+
+    __slots__ = ("buffer", "loaded_text", "text_end", "text_start")
+
+    def __init__(self, file_name, buffer, text_start, text_end):
+        #  The flags, ends, and tags are set by Snapshot.load().
+        self.file_name = sys.intern(file_name)
+        self.flags = b""
+        self.ends = array("q")
+        self.tags = {}
+        self.buffer = buffer
+        self.text_start = text_start
+        self.text_end = text_end
+        self.loaded_text = None
+
+    @property
+    def text(self):
+        if self.loaded_text is None:
+            self.loaded_text = str(
+                self.buffer[self.text_start : self.text_end], "utf-8", "surrogatepass"
+            )
+        return self.loaded_text
+
+
+class Snapshot:
+    """Binary file holding the results of a scan."""
+
+    magic = b"TDLSNAP\0"
+    version = 1
+    start = struct.Struct("<8sI")
+    end = struct.Struct("<Q")
+
+    __slots__ = ("buffer", "file_name", "n_files")
+
+    def __init__(self):
+        self.buffer = None
+        self.file_name = None
+        self.n_files = 0
+
+    def save(self, file_name):
+        """Write todo_files and the scan settings to a snapshot file."""
+        index_files = []
+        p = Path(file_name)
+        tmp = p.with_name(p.name + ".tmp")
+        with tmp.open("wb", buffering=output_buffer_size) as f:
+            f.write(self.start.pack(self.magic, self.version))
+            for todo_file in todo_files:
+                items = todo_file.todo_items
+                if not items:
+                    continue
+                text = items.text.encode("utf-8", "surrogatepass")
+                f.write(items.flags)
+                f.write(items.ends.tobytes())
+                f.write(text)
+                index_files.append(
+                    [
+                        todo_file.last_modified,
+                        todo_file.full_name,
+                        len(items),
+                        len(text),
+                        {str(i): list(tags) for i, tags in items.tags.items()},
+                    ]
+                )
+            index_offset = f.tell()
+            #  The JSON is ASCII, with surrogate escapes in file names kept
+            #  as \\u escapes.
+            index = {
+                "app": __version__,
+                "byteorder": sys.byteorder,
+                "dirs_to_scan": dirs_to_scan,
+                "dirs_to_exclude": dirs_to_exclude,
+                "error_messages": error_messages,
+                "files_scanned": self.n_files if self.buffer else len(file_list),
+                "files_skipped": files_skipped,
+                "files": index_files,
+            }
+            f.write(json.dumps(index, separators=(",", ":")).encode("ascii"))
+            f.write(self.end.pack(index_offset))
+        tmp.replace(p)
+        print("\nSaved snapshot [{0}].".format(file_name))
+
+    def load(self, file_name):
+        """Set todo_files and the scan settings from a snapshot file."""
+        global files_skipped  # noqa: PLW0603
+
+        self.file_name = file_name
+        try:
+            with Path(file_name).open("rb") as f:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version = self.start.unpack_from(self.buffer, 0)
+            if magic != self.magic or version != self.version:
+                msg = "not a snapshot, or from another version"
+                raise ValueError(msg)
+            (index_offset,) = self.end.unpack_from(
+                self.buffer, len(self.buffer) - self.end.size
+            )
+            index = json.loads(
+                self.buffer[index_offset : len(self.buffer) - self.end.size]
+            )
+            if index["byteorder"] != sys.byteorder:
+                msg = "saved on a system with another byte order"
+                raise ValueError(msg)
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            self.buffer = None
+            raise SystemExit(
+                "Cannot read snapshot [{0}]: {1}".format(file_name, e)
+            ) from e
+
+        dirs_to_scan[:] = [ScanProps(*d) for d in index["dirs_to_scan"]]
+        dirs_to_exclude[:] = index["dirs_to_exclude"]
+        error_messages[:] = index["error_messages"]
+        files_skipped = index["files_skipped"]
+        self.n_files = index["files_scanned"]
+
+        todo_files.clear()
+        pos = self.start.size
+        for last_modified, full_name, n_items, text_len, tags in index["files"]:
+            flags = self.buffer[pos : pos + n_items]
+            pos += n_items
+            ends = array("q")
+            ends.frombytes(self.buffer[pos : pos + n_items * ends.itemsize])
+            pos += n_items * ends.itemsize
+            items = SnapshotItems(full_name, self.buffer, pos, pos + text_len)
+            items.flags = flags
+            items.ends = ends
+            items.tags = {int(i): tuple(map(sys.intern, t)) for i, t in tags.items()}
+            pos += text_len
+            todo_files.append(TodoFile(last_modified, items.file_name, items))
+
+    def summary(self):
+        return "Loaded {0} files with to-do items, of {1} scanned, from [{2}].".format(
+            len(todo_files), self.n_files, self.file_name
+        )
+
+
+snapshot = Snapshot()
+
+
+def sort_todo_files(by_mtime: bool):
+    """Sort todo_files in the same order as sort_file_list."""
+    if by_mtime:
+        todo_files.sort(key=lambda f: (f.last_modified, f.full_name), reverse=True)
+    else:
+        todo_files.sort(key=lambda f: f.full_name.lower())
+
+
+#  endregion
+
+# ---------------------------------------------------------------------
+#  region -- Result store:
+
+
+def in_scanned_folder(path):
+    """Check if a file at path would be found by scanning dirs_to_scan."""
+    for scan_prop in dirs_to_scan:
+        dir_name = scan_prop.dir_name.rstrip(os.sep) + os.sep
+        if path.startswith(dir_name) and (
+            scan_prop.do_recurse or os.sep not in path[len(dir_name) :]
+        ):
+            return True
+    return False
+
+
+def store_text(s):
+    #  Characters that could not be decoded (kept as surrogate escapes)
+    #  cannot be stored, so they are replaced.
+    return s.encode("utf-8", "surrogateescape").decode("utf-8", "replace")
+
+
+def fts_phrase(word):
+    """Quote a word for an FTS5 query."""
+    if word.endswith("*"):
+        return '"{0}"*'.format(word[:-1].replace('"', '""'))
+    return '"{0}"'.format(word.replace('"', '""'))
+
+
+class ResultStore:
+    """SQLite database of the files with to-do items and their items."""
+
+    version = 1
+
+    #  Marks a database as written by this app ("TdLs"), so the tables of
+    #  another app's database are never dropped.
+    application_id = 0x54644C73
+
+    schema = """
+        CREATE TABLE files (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            last_modified TEXT NOT NULL,
+            checksum INTEGER NOT NULL
+        );
+        CREATE TABLE items (
+            id INTEGER PRIMARY KEY,
+            file_id INTEGER NOT NULL REFERENCES files (id),
+            position INTEGER NOT NULL,
+            flags INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            UNIQUE (file_id, position)
+        );
+        CREATE TABLE tags (
+            file_id INTEGER NOT NULL REFERENCES files (id),
+            position INTEGER NOT NULL,
+            tag TEXT NOT NULL COLLATE NOCASE
+        );
+        CREATE INDEX tags_tag ON tags (tag, file_id, position);
+        CREATE INDEX tags_file ON tags (file_id);
+    """
+
+    fts_schema = """
+        CREATE VIRTUAL TABLE items_fts USING fts5 (
+            text, content = 'items', content_rowid = 'id'
+        );
+        CREATE TRIGGER items_fts_insert AFTER INSERT ON items BEGIN
+            INSERT INTO items_fts (rowid, text) VALUES (new.id, new.text);
+        END;
+        CREATE TRIGGER items_fts_delete AFTER DELETE ON items BEGIN
+            INSERT INTO items_fts (items_fts, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END;
+    """
+
+    __slots__ = ("con", "file_name", "has_fts", "removed", "updated")
+
+    def __init__(self):
+        self.con = None
+        self.file_name = None
+        self.has_fts = False
+        self.updated = 0
+        self.removed = 0
+
+    def open(self, file_name, create=True):
+        """Open the database, creating the tables if needed."""
+        self.file_name = file_name
+        self.con = sqlite3.connect(file_name)
+        try:
+            app_id = self.con.execute("PRAGMA application_id").fetchone()[0]
+            version = self.con.execute("PRAGMA user_version").fetchone()[0]
+            n_tables = self.con.execute(
+                "SELECT count(*) FROM sqlite_master"
+            ).fetchone()[0]
+        except sqlite3.DatabaseError as e:
+            self.close()
+            raise SystemExit(
+                "Cannot use database [{0}]: {1}".format(file_name, e)
+            ) from None
+        if app_id != self.application_id and n_tables:
+            self.close()
+            raise SystemExit(
+                "Database [{0}] was not written by {1}.".format(file_name, app_name)
+            )
+        if version != self.version:
+            if not create:
+                raise SystemExit(
+                    "Database [{0}] is not up to date. Run {1} with --db to "
+                    "update it.".format(file_name, app_name)
+                )
+            self.create()
+        self.has_fts = (
+            self.con.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'items_fts'"
+            ).fetchone()
+            is not None
+        )
+
+    def create(self):
+        with self.con:
+            self.con.executescript(
+                "DROP TABLE IF EXISTS items_fts;"
+                "DROP TABLE IF EXISTS tags;"
+                "DROP TABLE IF EXISTS items;"
+                "DROP TABLE IF EXISTS files;"
+            )
+            self.con.executescript(self.schema)
+            try:
+                self.con.executescript(self.fts_schema)
+            except sqlite3.OperationalError as e:
+                print("Full-text search not available: {0}".format(e))
+            self.con.execute("PRAGMA user_version = {0}".format(self.version))
+            self.con.execute("PRAGMA application_id = {0}".format(self.application_id))
+
+    def close(self):
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+
+    def delete_items(self, file_id):
+        self.con.execute("DELETE FROM tags WHERE file_id = ?", (file_id,))
+        self.con.execute("DELETE FROM items WHERE file_id = ?", (file_id,))
+
+    def save_file(self, todo_file: TodoFile, checksum):
+        items = todo_file.todo_items
+        texts = [item.item_text for item in items]
+        path = todo_file.full_name
+        try:
+            path.encode("utf-8")
+            items.text.encode("utf-8")
+        except UnicodeEncodeError:
+            path = store_text(path)
+            texts = [store_text(text) for text in texts]
+
+        self.con.execute(
+            "INSERT INTO files (path, last_modified, checksum) VALUES (?, ?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET "
+            "last_modified = excluded.last_modified, checksum = excluded.checksum",
+            (path, todo_file.last_modified, checksum),
+        )
+        file_id = self.con.execute(
+            "SELECT id FROM files WHERE path = ?", (path,)
+        ).fetchone()[0]
+        self.delete_items(file_id)
+        self.con.executemany(
+            "INSERT INTO items (file_id, position, flags, text) VALUES (?, ?, ?, ?)",
+            (
+                (file_id, position, flags, text)
+                for position, (flags, text) in enumerate(zip(items.flags, texts))
+            ),
+        )
+        self.con.executemany(
+            "INSERT INTO tags (file_id, position, tag) VALUES (?, ?, ?)",
+            (
+                (file_id, position, tag)
+                for position, tags in items.tags.items()
+                for tag in dict.fromkeys(tags)
+            ),
+        )
+
+    def save(self, todo_files: list[TodoFile]):
+        """Store the files with to-do items that changed."""
+        stored = {
+            path: (file_id, last_modified, checksum)
+            for file_id, path, last_modified, checksum in self.con.execute(
+                "SELECT id, path, last_modified, checksum FROM files"
+            )
+        }
+        found = set()
+        with self.con:
+            for todo_file in todo_files:
+                if not todo_file.todo_items:
+                    continue
+                found.add(todo_file.full_name)
+                checksum = items_checksum(todo_file.todo_items)
+                row = stored.get(todo_file.full_name)
+                if row is None or row[1:] != (todo_file.last_modified, checksum):
+                    self.save_file(todo_file, checksum)
+                    self.updated += 1
+
+            for path, row in stored.items():
+                if path not in found and (
+                    in_scanned_folder(path) or not Path(path).exists()
+                ):
+                    self.delete_items(row[0])
+                    self.con.execute("DELETE FROM files WHERE id = ?", (row[0],))
+                    self.removed += 1
+
+    def query(self, q: ItemQuery):
+        """Return the items that match all the conditions of the query."""
+        sql = [
+            "SELECT f.path, f.last_modified, i.flags, i.text",
+            "FROM items AS i JOIN files AS f ON f.id = i.file_id WHERE 1",
+        ]
+        params: list[str | int] = []
+        for tag in q.tags:
+            sql.append(
+                "AND (i.file_id, i.position) IN "
+                "(SELECT file_id, position FROM tags WHERE tag = ?)"
+            )
+            params.append(tag if tag.startswith("#") else "#" + tag)
+        if q.flagged:
+            sql.append("AND i.flags & ?")
+            params.append(item_flagged)
+        if q.path:
+            sql.append("AND instr(f.path, ?) > 0")
+            params.append(q.path)
+        if q.since:
+            sql.append("AND f.last_modified >= ?")
+            params.append(q.since)
+        if q.words and self.has_fts:
+            sql.append(
+                "AND i.id IN (SELECT rowid FROM items_fts WHERE items_fts MATCH ?)"
+            )
+            params.append(" ".join(fts_phrase(word) for word in q.words))
+        else:
+            for word in q.words:
+                sql.append("AND instr(lower(i.text), ?) > 0")
+                params.append(word.rstrip("*").lower())
+        sql.append("ORDER BY f.path, i.position")
+        if q.limit > 0:
+            sql.append("LIMIT ?")
+            params.append(q.limit)
+        return self.con.execute(" ".join(sql), params)
+
+    def summary(self):
+        return "Result store: {0} files updated, {1} removed.".format(
+            self.updated, self.removed
+        )
+
+
+result_store = ResultStore()
+
+
+def query_results_text(rows):
+    """Yield the query results in the form of the text report."""
+    last_path = None
+    for path, last_modified, _flags, text in rows:
+        if path != last_path:
+            s = "-" * 70 + "\n"
+            s += path + "\n"
+            s += "  ({0})\n\n".format(last_modified)
+            yield s
+            last_path = path
+        yield text + "\n"
+
+
+def get_query_args(arglist=None):
+    ap = argparse.ArgumentParser(
+        prog="{0} --query".format(app_name),
+        description="List the to-do items stored in a database by running "
+        "{0} with --db, without scanning any folders.".format(app_name),
+    )
+
+    ap.add_argument(
+        "words",
+        nargs="*",
+        action="store",
+        help="Words to search for in the item text. Items must have all the "
+        "words. A word ending with '*' matches words that start with it.",
+    )
+
+    ap.add_argument(
+        "--db",
+        dest="db_file",
+        required=True,
+        action="store",
+        help="Database file to query.",
+    )
+
+    ap.add_argument(
+        "-t",
+        "--tag",
+        dest="tags",
+        default=[],
+        action="append",
+        help="Only list items with this tag (the leading '#' is optional). "
+        "Can be used more than once.",
+    )
+
+    ap.add_argument(
+        "--flagged",
+        dest="flagged",
+        action="store_true",
+        help="Only list flagged items.",
+    )
+
+    ap.add_argument(
+        "-p",
+        "--path",
+        dest="path",
+        default="",
+        action="store",
+        help="Only list items in files with this text in their path.",
+    )
+
+    ap.add_argument(
+        "--since",
+        dest="since",
+        default="",
+        action="store",
+        help="Only list items in files modified on or after this date (YYYY-MM-DD).",
+    )
+
+    ap.add_argument(
+        "--days",
+        dest="days",
+        type=int,
+        action="store",
+        help="Only list items in files modified in the last N days.",
+    )
+
+    ap.add_argument(
+        "--limit",
+        dest="limit",
+        type=int,
+        default=0,
+        action="store",
+        help="List at most this many items.",
+    )
+
+    args = ap.parse_args(arglist)
+
+    if args.since:
+        try:
+            datetime.strptime(args.since, "%Y-%m-%d")
+        except ValueError:
+            ap.error("--since must be a date in the form YYYY-MM-DD")
+
+    if args.days is not None and args.days < 0:
+        ap.error("--days cannot be less than zero")
+
+    return args
+
+
+def query_main(arglist=None):
+    args = get_query_args(arglist)
+
+    if not Path(args.db_file).exists():
+        raise SystemExit("Database not found: {0}".format(args.db_file))
+
+    since = args.since
+    if args.days is not None:
+        since = (datetime.now() - timedelta(days=args.days)).strftime("%Y-%m-%d %H:%M")
+
+    store = ResultStore()
+    store.open(args.db_file, create=False)
+    try:
+        rows = store.query(
+            ItemQuery(args.words, args.tags, args.flagged, args.path, since, args.limit)
+        ).fetchall()
+    finally:
+        store.close()
+
+    sys.stdout.writelines(query_results_text(rows))
+    print("{0} {1} found.".format(len(rows), "item" if len(rows) == 1 else "items"))
+    return 0
 
-def get_item_tags():
+
+#  endregion
+
+# ---------------------------------------------------------------------
+#  region -- Virtual report:
+
+#  Words in the item text and file paths, for the search index.
+search_word_regex = re.compile(r"\w+")
+
+#  Maps the ASCII characters that are not in a word to spaces, so splitting
+#  ASCII text gives the same words as search_word_regex, but faster.
+ascii_word_breaks = str.maketrans(
+    dict.fromkeys(
+        (c for c in map(chr, range(128)) if not (c.isalnum() or c == "_")), " "
+    )
+)
+
+
+def utf16_key(term):
+    #  Terms are sorted in the order of JavaScript string comparison, by
+    #  UTF-16 code units, so the script can search them for a prefix.
+    return term.encode("utf-16-be", "surrogatepass")
+
+
+def delta_list(values):
+    return [b - a for a, b in zip([0, *values], values)]
+
+
+class SearchIndex:
+    """Inverted index for the filter box in the virtual report."""
+
+    __slots__ = ("file_terms", "item_terms", "n_files", "n_items")
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.item_terms: defaultdict[str, list[int]] = defaultdict(list)
+        self.file_terms: defaultdict[str, list[int]] = defaultdict(list)
+        self.n_files = 0
+        self.n_items = 0
+
+    def add(self, items: FileItems):
+        if not items:
+            return
+
+        for term in set(search_word_regex.findall(items.file_name.lower())):
+            self.file_terms[term].append(self.n_files)
+        self.n_files += 1
+
+        item_terms = self.item_terms
+        text = items.text
+        is_ascii = text.isascii()
+        if is_ascii:
+            text = text.lower().translate(ascii_word_breaks)
+        n = self.n_items
+        start = 0
+        for end in items.ends:
+            if is_ascii:
+                words = text[start:end].split()
+            else:
+                #  Each item is made lower case on its own, as that can
+                #  change the length of the text.
+                words = search_word_regex.findall(text[start:end].lower())
+            for term in set(words):
+                item_terms[term].append(n)
+            n += 1
+            start = end
+
+        #  Tags start with '#', so they are terms of their own, added after
+        #  the words with the items still in order.
+        for index, tags in items.tags.items():
+            for tag in {tag.lower() for tag in tags}:
+                item_terms[tag].append(self.n_items + index)
+        self.n_items = n
+
+    def payload(self):
+        """Return the index as sorted terms with delta-coded numbers."""
+        item_terms = sorted(self.item_terms, key=utf16_key)
+        file_terms = sorted(self.file_terms, key=utf16_key)
+        return {
+            "terms": item_terms,
+            "items": [delta_list(self.item_terms[t]) for t in item_terms],
+            "pathTerms": file_terms,
+            "files": [delta_list(self.file_terms[t]) for t in file_terms],
+        }
+
+
+search_index = SearchIndex()
+
+
+def virtual_script():
+    #  Renders the report from the data in the todo_data script element.
+    #  The rows are rendered in blocks of blockSize as they come near the
+    #  view, and emptied again (keeping their height) when they move away.
+    #  The flagged and tagged rows are only rendered when their section is
+    #  opened. Each statement ends with a semicolon, and there are no line
+    #  comments, so the script still works after minify_parts.
+    return r"""
+<script>
+(function () {
+    "use strict";
+    var data = JSON.parse(document.getElementById("todo_data").textContent);
+    var blockSize = 100;
+    var fileStart = [];
+    var fileOf = [];
+    var fileIndex = Object.create(null);
+    var total = 0;
+
+    function linkName(path) {
+        return path.replace(/^[ \/\\]+|[ \/\\]+$/g, "").replace(/ /g, "_")
+            .replace(/\//g, "-").replace(/\./g, "-");
+    }
+
+    data.counts.forEach(function (count, f) {
+        fileStart.push(total);
+        for (var i = 0; i < count; i += 1) {
+            fileOf.push(f);
+        }
+        total += count;
+        fileIndex[linkName(data.paths[f])] = f;
+    });
+
+    function element(tag, className, text) {
+        var e = document.createElement(tag);
+        if (className) {
+            e.className = className;
+        }
+        if (text !== undefined) {
+            e.textContent = text;
+        }
+        return e;
+    }
+
+    function itemText(i) {
+        var div = element("div", "itemtext");
+        data.text[i].split("\n").forEach(function (line, n) {
+            if (n > 0) {
+                div.appendChild(element("br"));
+            }
+            div.appendChild(document.createTextNode(line));
+        });
+        return div;
+    }
+
+    function link(parent, href, text) {
+        var a = parent.appendChild(element("a", null, text));
+        a.href = href;
+        return a;
+    }
+
+    function mainRenderer(list) {
+        return function (block) {
+            var content = null;
+            for (var k = block.start; k < block.end; k += 1) {
+                var i = list[k];
+                var f = fileOf[i];
+                var row = i - fileStart[f] + 1;
+                var newFile = k === 0 || fileOf[list[k - 1]] !== f;
+                if (newFile) {
+                    var header = block.appendChild(element("div", "fileheader"));
+                    header.id = linkName(data.paths[f]);
+                    header.appendChild(element("p", "filename")).appendChild(
+                        element("a", null, data.paths[f])
+                    );
+                    header.appendChild(
+                        element("p", "filetime", "Modified " + data.modified[f])
+                    );
+                }
+                if (newFile || content === null) {
+                    content = block.appendChild(element("div", "filecontent"));
+                }
+                var flagged = data.flags[i] !== "0" ? " flagged" : "";
+                content.appendChild(element("div", "item" + (row % 2) + flagged))
+                    .appendChild(itemText(i));
+                if (k === list.length - 1 || fileOf[list[k + 1]] !== f) {
+                    var top = content.appendChild(element("p", "toplink", "("));
+                    link(top, "#contents_section", "top");
+                    top.appendChild(document.createTextNode(")"));
+                }
+            }
+        };
+    }
+
+    function refRenderer(items, className) {
+        return function (block) {
+            for (var k = block.start; k < block.end; k += 1) {
+                var i = items[k];
+                var path = data.paths[fileOf[i]];
+                var row = element("div", className + ((k + 1) % 2));
+                var p = row.appendChild(element("p", "flink"));
+                link(p, "#" + linkName(path), path);
+                block.appendChild(row);
+                row.appendChild(itemText(i));
+            }
+        };
+    }
+
+    function show(block) {
+        if (!block.shown) {
+            block.style.height = "";
+            block.render(block);
+            block.shown = true;
+        }
+    }
+
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            var block = entry.target;
+            if (entry.isIntersecting) {
+                show(block);
+            } else if (block.shown) {
+                block.style.height = block.offsetHeight + "px";
+                block.textContent = "";
+                block.shown = false;
+            }
+        });
+    }, {rootMargin: "1500px 0px"});
+
+    function virtualList(box, count, render, rowHeight) {
+        var blocks = [];
+        for (var start = 0; start < count; start += blockSize) {
+            var block = box.appendChild(element("div"));
+            block.start = start;
+            block.end = Math.min(start + blockSize, count);
+            block.render = render;
+            block.style.height = (block.end - block.start) * rowHeight + "px";
+            blocks.push(block);
+            observer.observe(block);
+        }
+        return blocks;
+    }
+
+    function renderOnOpen(details, items, className) {
+        var box = details.querySelector("div");
+        details.addEventListener("toggle", function () {
+            if (details.open && !box.hasChildNodes()) {
+                virtualList(box, items.length, refRenderer(items, className), 80);
+            }
+        });
+    }
+
+    var mainBox = document.getElementById("main_items");
+    var mainList = [];
+    var mainBlocks = [];
+    var allItems = [];
+    for (var i = 0; i < total; i += 1) {
+        allItems.push(i);
+    }
+
+    function showMain(list) {
+        mainBlocks.forEach(function (block) {
+            observer.unobserve(block);
+        });
+        mainBox.textContent = "";
+        mainList = list;
+        mainBlocks = virtualList(mainBox, list.length, mainRenderer(list), 60);
+    }
+
+    showMain(allItems);
+
+    function lowerBound(sorted, value) {
+        var low = 0;
+        var high = sorted.length;
+        while (low < high) {
+            var mid = (low + high) >> 1;
+            if (sorted[mid] < value) {
+                low = mid + 1;
+            } else {
+                high = mid;
+            }
+        }
+        return low;
+    }
+
+    var flaggedDetails = document.getElementById("flagged_details");
+    if (flaggedDetails) {
+        var flaggedItems = allItems.filter(function (i) {
+            return Number(data.flags[i]) & 1;
+        });
+        renderOnOpen(flaggedDetails, flaggedItems, "flag");
+    }
+
+    document.querySelectorAll("details.tagrows").forEach(function (details, n) {
+        renderOnOpen(details, data.tags[n][1], "tag");
+    });
+
+    function showTarget() {
+        var id = decodeURIComponent(location.hash.slice(1));
+        var f = fileIndex[id];
+        if (f === undefined) {
+            return;
+        }
+        var k = lowerBound(mainList, fileStart[f]);
+        if (k === mainList.length || fileOf[mainList[k]] !== f) {
+            return;
+        }
+        show(mainBlocks[Math.floor(k / blockSize)]);
+        document.getElementById(id).scrollIntoView();
+    }
+
+    window.addEventListener("hashchange", showTarget);
+    document.addEventListener("click", function (event) {
+        if (event.target.closest("a[href^='#']")) {
+            setTimeout(showTarget, 0);
+        }
+    });
+    showTarget();
+
+    var search = data.search;
+    var filterBox = document.getElementById("filter");
+    if (!search || !filterBox) {
+        return;
+    }
+
+    function eachMatch(terms, postings, prefix, found) {
+        var t = lowerBound(terms, prefix);
+        while (t < terms.length && terms[t].lastIndexOf(prefix, 0) === 0) {
+            var n = 0;
+            var deltas = postings[t];
+            for (var j = 0; j < deltas.length; j += 1) {
+                n += deltas[j];
+                found(n);
+            }
+            t += 1;
+        }
+    }
+
+    function filterItems(query) {
+        var words = query.toLowerCase().match(/#?[\p{L}\p{N}_]+/gu);
+        if (!words) {
+            return allItems;
+        }
+        var hits = new Uint16Array(total);
+        var lastWord = new Uint16Array(total);
+        words.forEach(function (word, w) {
+            function hit(i) {
+                if (lastWord[i] !== w + 1) {
+                    lastWord[i] = w + 1;
+                    hits[i] += 1;
+                }
+            }
+            eachMatch(search.terms, search.items, word, hit);
+            if (word.charAt(0) !== "#") {
+                eachMatch(search.pathTerms, search.files, word, function (f) {
+                    var end = fileStart[f] + data.counts[f];
+                    for (var i = fileStart[f]; i < end; i += 1) {
+                        hit(i);
+                    }
+                });
+            }
+        });
+        return allItems.filter(function (i) {
+            return hits[i] === words.length;
+        });
+    }
+
+    var pending = 0;
+    filterBox.addEventListener("input", function () {
+        cancelAnimationFrame(pending);
+        pending = requestAnimationFrame(function () {
+            var list = filterItems(filterBox.value);
+            showMain(list);
+            document.getElementById("filter_count").textContent = (
+                list.length === total ? "" : list.length + " of " + total + " items"
+            );
+        });
+    });
+}());
+</script>
+"""
+
+
+def virtual_payload():
+    """Return the data for the virtual HTML report."""
+    paths = []
+    modified = []
+    counts = []
+    text = []
+    flags = []
+    offsets = {}
+    for todo_file in todo_files:
+        items = todo_file.todo_items
+        if not items:
+            continue
+        offsets[todo_file.full_name] = len(text)
+        paths.append(todo_file.full_name)
+        modified.append(todo_file.last_modified)
+        counts.append(len(items))
+        text.extend(item.item_text for item in items)
+        flags.append("".join(map(str, items.flags)))
+
+    tags = [
+        [tag, [offsets[file_items.file_name] + i for file_items, i in refs.refs()]]
+        for tag, refs in sorted(item_tags.items())
+    ]
+
+    return {
+        "paths": paths,
+        "modified": modified,
+        "counts": counts,
+        "text": text,
+        "flags": "".join(flags),
+        "tags": tags,
+    }
+
+
+def virtual_payload_json(payload):
+    #  Escaping '<' keeps the JSON from closing the script element.
+    s = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return s.replace("<", "\\u003c")
+
+
+def virtual_sections_parts(payload):
+    if flagged_items:
+        s = '<div id="flagged_section">\n'
+        s += "<h2><a>Flagged Items</a></h2>\n"
+        s += '<details id="flagged_details">\n'
+        s += "<summary>Flagged items ({0})</summary>\n".format(len(flagged_items))
+        s += '<div id="flagged_items"></div>\n'
+        s += "</details>\n"
+        s += "</div>  <!--end flagged_section -->\n\n"
+        yield s
+
+    if payload["tags"]:
+        s = '<div id="tags_section">\n'
+        s += "<h2><a>Tagged Items</a></h2>\n"
+        s += '<div id="tagged_items">\n'
+        yield s
+        for tag, indexes in payload["tags"]:
+            s = '<details class="tagrows">\n'
+            s += '<summary class="tagheader">Tag: <strong>{0}</strong> ({1})'.format(
+                html_text(tag), len(indexes)
+            )
+            s += "</summary>\n<div></div>\n</details>\n"
+            yield s
+        yield "</div>  <!--end tagged_items -->\n"
+        yield "</div>  <!--end tags_section -->\n\n"
+
+    main_parts = [
+        '<div id="main_items"></div>\n',
+        "<noscript><p>This report needs JavaScript.</p></noscript>\n",
+    ]
+    if "search" in payload:
+        main_parts.insert(
+            0,
+            '<p class="filter"><input id="filter" type="search" '
+            'placeholder="Filter items" aria-label="Filter items"> '
+            '<span id="filter_count"></span></p>\n',
+        )
+    yield from main_section_parts(main_parts)
+
+
+def virtual_html_parts(page_title: str, by_mtime: bool, search=False):
+    """Return the parts of the virtual HTML report."""
+    payload = virtual_payload()
+    if search:
+        payload["search"] = search_index.payload()
+    return html_page_parts(
+        page_title,
+        by_mtime,
+        [
+            contents_section(todo_files, bool(flagged_items), bool(item_tags)),
+            *changes_sections(),
+            virtual_sections_parts(payload),
+            (
+                '<script type="application/json" id="todo_data">',
+                virtual_payload_json(payload),
+                "</script>\n",
+                virtual_script(),
+            ),
+        ],
+    )
+
+
+#  endregion
+
+# ---------------------------------------------------------------------
+
+
+def get_item_tags(search: SearchIndex | None = None):
+    """Collect the tagged items, and add the items to the search index."""
     for todo_file in todo_files:
-        for item in todo_file.todo_items:
-            s = prune(item.item_text)
-            #  Split into words (which might not really be words).
-            wurdz = s.split(" ")
-            for wurd in wurdz:
-                if len(wurd) > 1 and wurd.startswith("#"):
-                    if wurd in item_tags:
-                        item_tags[wurd].append(item)
-                    else:
-                        item_tags[wurd] = [item]
+        items = todo_file.todo_items
+        for index, tags in items.tags.items():
+            for tag in tags:
+                if tag not in item_tags:
+                    item_tags[tag] = ItemRefs()
+                item_tags[tag].append(items, index)
+        if search is not None:
+            search.add(items)
+
+
+# ---------------------------------------------------------------------
+#  region -- Watch mode:
+
+#  Seconds without further changes before the outputs are rewritten.
+watch_debounce_seconds = 1.0
+
+#  Seconds between scans when polling for changes.
+default_poll_interval = 5.0
+
+
+class InotifyWatcher:
+    """Watches the scanned directories for changes using inotify."""
+
+    settled = False
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+
+    watch_mask = (
+        IN_MODIFY
+        | IN_CLOSE_WRITE
+        | IN_MOVED_FROM
+        | IN_MOVED_TO
+        | IN_CREATE
+        | IN_DELETE
+        | IN_DELETE_SELF
+        | IN_MOVE_SELF
+    )
+
+    event_header = struct.Struct("iIII")
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.watches: dict[int, str] = {}
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_watch(self, dir_name):
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(dir_name), self.watch_mask
+        )
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, "The inotify watch limit was reached")
+            print("Cannot watch [{0}]: {1}".format(dir_name, os.strerror(err)))
+            return
+        self.watches[wd] = dir_name
+
+    def add_tree(self, dir_name, do_recurse):
+        for path, _ in walk_dirs(dir_name, do_recurse):
+            self.add_watch(path)
+
+    def remove_tree(self, dir_name):
+        prefix = dir_name + os.sep
+        for wd, path in list(self.watches.items()):
+            if path == dir_name or path.startswith(prefix):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def read_changes(self, timeout) -> set[str]:
+        """Wait up to timeout seconds for changes."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changes = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changes
+
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, name_len = self.event_header.unpack_from(data, pos)
+            pos += self.event_header.size
+            name = os.fsdecode(data[pos : pos + name_len].rstrip(b"\0"))
+            pos += name_len
+
+            if mask & self.IN_Q_OVERFLOW:
+                #  Events were lost, so rescan everything.
+                changes.update(sp.dir_name for sp in dirs_to_scan)
+                continue
+
+            dir_name = self.watches.get(wd)
+            if dir_name is None:
+                continue
+
+            if mask & self.IN_IGNORED:
+                del self.watches[wd]
+                continue
+
+            if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                changes.add(dir_name)
+                continue
+
+            path = str(Path(dir_name) / name)
+            changes.add(path)
+            if mask & self.IN_ISDIR:
+                if mask & self.IN_MOVED_FROM:
+                    self.remove_tree(path)
+                elif mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    scan_prop = scan_root_for(path)
+                    if scan_prop is not None and scan_prop.do_recurse:
+                        self.add_tree(path, True)
+
+        return changes
+
+
+class PollingWatcher:
+    """Checks for changes by scanning the directories again."""
+
+    #  Each result compares two full scans, so there is no need to wait for
+    #  the changes to settle.
+    settled = True
+
+    def __init__(self, interval, known_files: dict[str, FileInfo]):
+        self.interval = interval
+        self.last_scan = {name: (f.size, f.mtime_ns) for name, f in known_files.items()}
+
+    def close(self):
+        pass
+
+    def read_changes(self, timeout) -> set[str]:
+        time.sleep(self.interval if timeout is None else timeout)
+
+        #  Errors were reported in the initial scan, so do not add them again.
+        n_errors = len(error_messages)
+        scan = {}
+        for scan_prop in dirs_to_scan:
+            for f in walk_matching_files(scan_prop.dir_name, scan_prop.do_recurse):
+                scan[f.full_name] = (f.size, f.mtime_ns)
+        del error_messages[n_errors:]
+
+        changes = {
+            name for name, stat in scan.items() if self.last_scan.get(name) != stat
+        }
+        changes.update(name for name in self.last_scan if name not in scan)
+        self.last_scan = scan
+        return changes
+
+
+def scan_root_for(path) -> ScanProps | None:
+    """Return the scanned folder that path is in, or None."""
+    parent = str(Path(path).parent)
+    for scan_prop in dirs_to_scan:
+        root = scan_prop.dir_name
+        if root in (path, parent):
+            return scan_prop
+        if scan_prop.do_recurse and path.startswith(root + os.sep):
+            return scan_prop
+    return None
+
+
+def in_scanned_tree(path) -> bool:
+    """Check that path is in a scanned folder and not excluded."""
+    scan_prop = scan_root_for(path)
+    if scan_prop is None:
+        return False
+    d = Path(scan_prop.dir_name)
+    p = Path(path)
+    if p == d:
+        return True
+    rules = child_ignore_rules(str(d), ignore_files_in(d), ())
+    for part in p.relative_to(d).parts[:-1]:
+        d = d / part
+        if skip_dir(str(d), rules):
+            return False
+        rules = child_ignore_rules(str(d), ignore_files_in(d), rules)
+    if p.is_dir():
+        return not skip_dir(path, rules)
+    return True
+
+
+def refresh_watched_paths(
+    paths, known_files: dict[str, FileInfo], known_items: dict[str, list]
+):
+    """Update known_files and known_items for the changed paths."""
+    removed = {}
+
+    def forget(name):
+        removed[name] = (known_files.pop(name), known_items.pop(name))
+
+    new_files = {}
+    for changed_path in sorted(paths):
+        path = changed_path
+        #  Forget the path, and anything below it if it was a directory.
+        prefix = path + os.sep
+        for name in [n for n in known_files if n == path or n.startswith(prefix)]:
+            forget(name)
+
+        if not in_scanned_tree(path):
+            continue
+
+        p = Path(path)
+        if use_ignore_files and p.name in ignore_file_names:
+            #  The ignore rules for the directory may have changed, so scan it
+            #  again.
+            p = p.parent
+            path = str(p)
+            prefix = path + os.sep
+            for name in [n for n in known_files if n.startswith(prefix)]:
+                forget(name)
+
+        if p.is_dir() and not p.is_symlink():
+            scan_prop = scan_root_for(path)
+            if path == scan_prop.dir_name or scan_prop.do_recurse:
+                for file_info in walk_matching_files(path, scan_prop.do_recurse):
+                    new_files[file_info.full_name] = file_info
+        elif (
+            p.is_file()
+            and matches_filespec(p.name)
+            and not scan_filter.ignores_file(path)
+            and not ignored_by_rules(inherited_ignore_rules(str(p.parent)), path, False)
+        ):
+            try:
+                new_files[path] = file_info_from_stat(path, p.stat())
+            except FileNotFoundError:
+                continue
+
+    return add_known_files(new_files, removed, known_files, known_items)
+
+
+def add_known_files(
+    new_files: dict[str, FileInfo],
+    removed: dict[str, tuple],
+    known_files: dict[str, FileInfo],
+    known_items: dict[str, list],
+):
+    """Add the files found again after a change, reading only changed files."""
+    changed = False
+    for name, file_info in new_files.items():
+        old_info, old_items = removed.pop(name, (None, None))
+        known_files[name] = file_info
+        if file_info == old_info:
+            known_items[name] = old_items
+        else:
+            known_items[name] = read_todo_file(file_info)
+            changed = True
+    return changed or bool(removed)
+
+
+def own_file_matcher(opts: AppOptions) -> Callable[[str], bool]:
+    """Return a function that checks if a path is a file written by a run."""
+    #  The HTML and text outputs, text outputs with the date and time, and
+    #  the pages of split output.
+    stem = str(Path(opts.output_file).expanduser().resolve().with_suffix(""))
+    patterns = [re.escape(stem) + r"(?:\.html|\.txt|_\d{8}_\d{6}\.txt|-\d+\.html)"]
+    patterns.extend(
+        re.escape(str(Path(file_name).expanduser().resolve()))
+        + "(?:-journal|-wal|-shm)?"
+        for file_name in (opts.db_file, opts.save_snapshot, opts.changes_file)
+        if file_name
+    )
+    regex = re.compile("|".join(patterns))
+    cache_dir = (
+        str(Path(opts.cache_dir).expanduser().resolve()) if opts.cache_dir else None
+    )
+
+    def is_own_file(path):
+        if cache_dir and (path == cache_dir or path.startswith(cache_dir + os.sep)):
+            return True
+        p = Path(path)
+        name = p.name.removesuffix(".tmp")
+        if name.startswith(".") and name.endswith(".fingerprint"):
+            name = name[1 : -len(".fingerprint")]
+        return regex.fullmatch(str(p.with_name(name))) is not None
+
+    return is_own_file
+
+
+def rebuild_outputs(
+    opts: AppOptions, known_files: dict[str, FileInfo], known_items: dict[str, list]
+):
+    global run_dt  # noqa: PLW0603
+    run_dt = datetime.now()
+
+    file_list[:] = known_files.values()
+    sort_file_list(opts.by_mtime)
+
+    todo_files[:] = [
+        TodoFile(f.last_modified, f.full_name, known_items[f.full_name])
+        for f in file_list
+    ]
+
+    write_outputs(opts)
+    parse_cache.save()
+    fragment_cache.save()
+
 
+def make_watcher(opts: AppOptions, known_files: dict[str, FileInfo]):
+    if opts.poll_interval is None:
+        try:
+            watcher = InotifyWatcher()
+        except (OSError, AttributeError) as e:
+            print("Cannot use inotify ({0}). Polling for changes.".format(e))
+        else:
+            try:
+                for scan_prop in dirs_to_scan:
+                    watcher.add_tree(scan_prop.dir_name, scan_prop.do_recurse)
+            except OSError as e:
+                watcher.close()
+                print("{0}. Polling for changes.".format(e))
+            else:
+                return watcher
+
+    return PollingWatcher(opts.poll_interval or default_poll_interval, known_files)
+
+
+def watch(opts: AppOptions):
+    """Rewrite the outputs when matching files change."""
+    known_files = {f.full_name: f for f in file_list}
+    known_items = {t.full_name: t.todo_items for t in todo_files}
+
+    is_own_file = own_file_matcher(opts)
+    watcher = make_watcher(opts, known_files)
+    print("\nWatching for changes. Press Ctrl+C to stop.")
+    try:
+        while True:
+            changes = watcher.read_changes(None)
+            #  Wait for the changes to settle, as saving a file can cause
+            #  several events.
+            while not watcher.settled:
+                more = watcher.read_changes(watch_debounce_seconds)
+                if not more:
+                    break
+                changes |= more
+
+            #  Writing the outputs causes events that are not changes.
+            changes = {path for path in changes if not is_own_file(path)}
+            n_files = len(known_files)
+            if changes and refresh_watched_paths(changes, known_files, known_items):
+                print(
+                    "{0} change(s), {1} file(s) before, {2} now.".format(
+                        len(changes), n_files, len(known_files)
+                    )
+                )
+                rebuild_outputs(opts, known_files, known_items)
+
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+    finally:
+        watcher.close()
+
+
+#  endregion
 
 # ---------------------------------------------------------------------
 
@@ -866,6 +4223,32 @@ def get_args(arglist=None):
         "a text file output.",
     )
 
+    ap.add_argument(
+        "--skip-unchanged",
+        dest="skip_unchanged",
+        action="store_true",
+        help="Do not write an output file, or open the browser, if the report "
+        "content is the same as when the file was last written (the creation "
+        "date and time are not compared). A fingerprint of the content is "
+        "saved in a hidden file next to each output file.",
+    )
+
+    ap.add_argument(
+        "--compact",
+        dest="compact",
+        action="store_true",
+        help="Show the text of each item only once in the HTML output, in the "
+        "Files section. The Flagged and Tagged sections show the first line "
+        "of each item, linked to the item.",
+    )
+
+    ap.add_argument(
+        "--minify",
+        dest="minify",
+        action="store_true",
+        help="Remove the line breaks and indentation between tags in the HTML output.",
+    )
+
     ap.add_argument(
         "-x",
         "--exclude-path",
@@ -902,7 +4285,238 @@ def get_args(arglist=None):
         "pattern '*.md' would cause all Markdown files to be included.",
     )
 
-    return ap.parse_args(arglist)
+    ap.add_argument(
+        "--scan-workers",
+        dest="scan_workers",
+        metavar="N",
+        type=int,
+        default=0,
+        action="store",
+        help="Number of threads to use for scanning folders. Directory "
+        "listings are done in parallel, across folders and their sub-folders. "
+        "Can speed up scanning network drives. Default is to scan on a "
+        "single thread.",
+    )
+
+    ap.add_argument(
+        "--parse-workers",
+        dest="parse_workers",
+        metavar="N",
+        type=int,
+        default=0,
+        action="store",
+        help="Number of processes to use for reading the files. The largest "
+        "files are read first. Default is to read the files in a single "
+        "process.",
+    )
+
+    ap.add_argument(
+        "--pipeline",
+        dest="pipeline_workers",
+        metavar="N",
+        type=int,
+        default=0,
+        action="store",
+        help="Read files while the folders are still being scanned, using N "
+        "threads to read the files. The --parse-workers option is not used in "
+        "this mode.",
+    )
+
+    ap.add_argument(
+        "--spool",
+        dest="spool",
+        action="store_true",
+        help="Write the report sections to temporary files while reading, "
+        "and put the output files together from them at the end, so the "
+        "to-do items of only one file are held in memory at a time. For very "
+        "large sets of files. The --parse-workers and --pipeline options are "
+        "not used in this mode, only the folder listings are cached, and it "
+        "cannot be used with --watch.",
+    )
+
+    ap.add_argument(
+        "--db",
+        dest="db_file",
+        action="store",
+        help="SQLite database file to store the files and to-do items found "
+        "in, for --query. Only the files that changed since the "
+        "last run are updated. Run '%(prog)s --query -h' for the query options.",
+    )
+
+    ap.add_argument(
+        "--query",
+        action="store_true",
+        help="List the to-do items stored in a --db database, instead of "
+        "scanning. Must be the first argument. Run '%(prog)s --query -h' for "
+        "the query options.",
+    )
+
+    ap.add_argument(
+        "--changes",
+        dest="changes_file",
+        action="store",
+        help="File to keep a fingerprint of each to-do item in. The reports "
+        "then include the items that are new, moved to another file, or closed "
+        "since the last run that used the same file.",
+    )
+
+    ap.add_argument(
+        "--save-snapshot",
+        dest="save_snapshot",
+        action="store",
+        help="Save the files and to-do items found to this snapshot file, so "
+        "the outputs can be written again using --from-snapshot.",
+    )
+
+    ap.add_argument(
+        "--from-snapshot",
+        dest="from_snapshot",
+        action="store",
+        help="Write the outputs from the files and to-do items in this snapshot "
+        "file, without scanning any folders. The folders given, or set in the "
+        "options file, are not used.",
+    )
+
+    ap.add_argument(
+        "--split-output",
+        dest="split_output",
+        action="store_true",
+        help="Split the HTML output into pages, one for each folder scanned, "
+        "holding the to-do items of the files in that folder. The output file "
+        "is an index page with the contents, flagged items, and tagged items, "
+        "that link to the pages. A page is only written when its content "
+        "changed.",
+    )
+
+    ap.add_argument(
+        "--split-files",
+        dest="split_files",
+        type=int,
+        default=0,
+        action="store",
+        help="Split the HTML output into pages of this many files each, "
+        "instead of one page for each folder scanned. Implies --split-output.",
+    )
+
+    ap.add_argument(
+        "--virtual",
+        dest="virtual",
+        action="store_true",
+        help="Write the to-do items to the HTML output once, as data, with a "
+        "script that shows only the items scrolled into view, and the flagged "
+        "and tagged items when their section is opened. For reports with very "
+        "many items. The report needs JavaScript to be shown.",
+    )
+
+    ap.add_argument(
+        "--search",
+        dest="search",
+        action="store_true",
+        help="Add a box to filter the to-do items by words in their text, "
+        "tags, or file path, using an index built when the report is "
+        "written. Implies --virtual.",
+    )
+
+    ap.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        action="store",
+        help="Folder for cache files. When given, the folder listings and the "
+        "to-do items read from each file are cached. Folders and files that "
+        "have not changed since the last run are not listed or read again.",
+    )
+
+    ap.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        help="Do not use the cache, even if a cache folder is set in the options file.",
+    )
+
+    ap.add_argument(
+        "--rebuild-cache",
+        dest="rebuild_cache",
+        action="store_true",
+        help="Discard the existing cache contents and read all files again.",
+    )
+
+    ap.add_argument(
+        "--watch",
+        dest="watch",
+        action="store_true",
+        help="Keep running after creating the report, and update the output "
+        "files when matching files are created, changed, or deleted. Only the "
+        "changed files are read again. Press Ctrl+C to stop.",
+    )
+
+    ap.add_argument(
+        "--poll-interval",
+        dest="poll_interval",
+        type=float,
+        metavar="SECONDS",
+        action="store",
+        help="With --watch, check for changes by scanning the folders every "
+        "SECONDS seconds, instead of using inotify. Polling is also used when "
+        "inotify is not available.",
+    )
+
+    ap.add_argument(
+        "--no-prune",
+        dest="no_prune",
+        action="store_true",
+        help="Scan all sub-folders, including folders such as '.git' and "
+        "'node_modules' that are skipped by default (or the folders listed in "
+        "the [prune] section of the options file).",
+    )
+
+    ap.add_argument(
+        "--no-ignore-files",
+        dest="no_ignore_files",
+        action="store_true",
+        help="Do not use the rules in .gitignore and .todolisterignore files "
+        "found in the scanned folders.",
+    )
+
+    args = ap.parse_args(arglist)
+    check_args(ap, args)
+    return args
+
+
+def check_args(ap: argparse.ArgumentParser, args: argparse.Namespace):
+    """Exit with an error for options that cannot be used together."""
+    if args.query:
+        ap.error("--query must be the first argument")
+
+    if args.spool and args.watch:
+        ap.error("--spool cannot be used with --watch")
+
+    if args.spool and args.db_file:
+        ap.error("--spool cannot be used with --db")
+
+    if args.spool and args.changes_file:
+        ap.error("--spool cannot be used with --changes")
+
+    if args.from_snapshot and (args.spool or args.watch):
+        ap.error("--from-snapshot cannot be used with --spool or --watch")
+
+    if args.spool and args.save_snapshot:
+        ap.error("--spool cannot be used with --save-snapshot")
+
+    if args.from_snapshot and args.save_snapshot:
+        same = Path(args.from_snapshot).resolve() == Path(args.save_snapshot).resolve()
+        if same:
+            ap.error("--save-snapshot cannot be the same file as --from-snapshot")
+
+    if args.split_files < 0:
+        ap.error("--split-files cannot be less than zero")
+
+    if args.spool and (args.split_output or args.split_files):
+        ap.error("--spool cannot be used with --split-output or --split-files")
+
+    if (args.virtual or args.search) and (
+        args.spool or args.split_output or args.split_files
+    ):
+        ap.error("--virtual cannot be used with --spool or --split-output")
 
 
 def get_options(arglist=None):
@@ -944,6 +4558,10 @@ def get_options(arglist=None):
 
     getopt_ignore(opt_lines)
 
+    getopt_prune(args.no_prune, opt_lines)
+
+    scan_filter.compile(dirs_to_exclude, ignore_list, prune_list)
+
     getopt_filespecs(opt_lines)
 
     if args.add_match:
@@ -954,55 +4572,272 @@ def get_options(arglist=None):
             add_match = f".{add_match}"
         file_specs.extend([add_match])
 
+    file_matcher.compile(file_specs)
+
     return AppOptions(
         args.folders,
         args.optfile,
         args.recurse,
+        args.no_ignore_files,
         getopt_by_mtime(args.by_mtime, opt_lines),
         args.output_file,
         getopt_do_text(args.do_text, opt_lines),
         getopt_do_text_dt(args.do_text_dt, opt_lines),
         getopt_no_html(args.no_html, opt_lines),
+        getopt_skip_unchanged(args.skip_unchanged, opt_lines),
+        getopt_compact(args.compact, opt_lines),
+        getopt_minify(args.minify, opt_lines),
+        args.split_output or args.split_files > 0,
+        args.split_files,
+        args.virtual or args.search,
+        args.search,
         getopt_title(args.page_title, opt_lines),
         args.no_browser,
+        args.scan_workers,
+        None if args.no_cache else getopt_cache_dir(args.cache_dir, opt_lines),
+        args.rebuild_cache,
+        args.watch,
+        args.poll_interval,
+        args.parse_workers,
+        args.pipeline_workers,
+        args.spool,
+        args.db_file,
+        args.changes_file,
+        args.save_snapshot,
+        args.from_snapshot,
     )
 
 
-def main(arglist=None):
-    print("Running {0}.".format(app_title))
+def iter_scan_folders(
+    opts: AppOptions, listed: Callable[[list[FileInfo]], None] | None = None
+) -> Iterator[FileInfo]:
+    if opts.scan_workers > 1:
+        yield from walk_matching_files_parallel(dirs_to_scan, opts.scan_workers, listed)
+    else:
+        for scan_prop in dirs_to_scan:
+            print("Scanning folder [{0}]".format(scan_prop.dir_name))
+            yield from walk_matching_files(scan_prop.dir_name, scan_prop.do_recurse)
 
-    opts = get_options(arglist)
 
-    assert opts.output_file is not None  # noqa: S101
+def scan_folders(opts: AppOptions):
+    file_list.extend(iter_scan_folders(opts))
 
-    if debug_stop_after_args:
-        raise SystemExit("STOPPED")
-
-    for scan_prop in dirs_to_scan:
-        print("Scanning folder [{0}]".format(scan_prop.dir_name))
-        get_matching_files(scan_prop.dir_name, scan_prop.do_recurse)
 
-    if opts.by_mtime:
+def sort_file_list(by_mtime: bool):
+    if by_mtime:
         #  The last_modified field is the default for sort.
         file_list.sort()
         file_list.reverse()
     else:
         file_list.sort(key=lambda item: item.full_name.lower())
 
+
+def scan_and_read_pipelined(opts: AppOptions):
+    """Scan the folders and read the files at the same time."""
+    file_queue: queue.Queue[FileInfo | None] = queue.Queue(maxsize=pipeline_queue_size)
+    read_results = {}
+
+    def reader():
+        while True:
+            file_info = file_queue.get()
+            if file_info is None:
+                break
+            print("Reading file [{0}]".format(file_info.full_name))
+            try:
+                result = read_todo_items(file_info.full_name)
+            except Exception as e:
+                #  Keep reading, so the scan does not block on a full queue.
+                #  The exception is raised again after the scan.
+                result = e
+            read_results[file_info.full_name] = result
+
+    threads = [
+        threading.Thread(target=reader, daemon=True)
+        for _ in range(opts.pipeline_workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    cached = {}
+    queued = set()
+
+    def queue_files(file_infos):
+        for file_info in file_infos:
+            if file_info.full_name in queued:
+                continue
+            queued.add(file_info.full_name)
+            items = parse_cache.get(file_info)
+            if items is None:
+                file_queue.put(file_info)
+            else:
+                cached[file_info.full_name] = items
+
+    try:
+        for file_info in iter_scan_folders(opts, queue_files):
+            file_list.append(file_info)
+            queue_files((file_info,))
+    finally:
+        for _ in threads:
+            file_queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    #  Sort after reading, using the same order as a phased run.
+    sort_file_list(opts.by_mtime)
+
     for file_info in file_list:
-        print("Reading file [{0}]".format(file_info.full_name))
-        items = get_todo_items(file_info.full_name)
+        items = cached.get(file_info.full_name)
+        if items is None:
+            result = read_results[file_info.full_name]
+            if isinstance(result, Exception):
+                raise result
+            items = accept_read_result(file_info, *result)
         todo_files.append(TodoFile(file_info.last_modified, file_info.full_name, items))
 
-    get_flagged_items()
 
-    get_item_tags()
+def write_outputs(opts: AppOptions, spool: ReportSpool | None = None):
+    """Collect the flagged and tagged items and write the output files."""
+    unchanged_outputs.clear()
+    page_names.clear()
+    split = opts.split_output and not opts.no_html
+
+    if spool is None:
+        flagged_items.clear()
+        get_flagged_items()
+
+        item_tags.clear()
+        search_index.clear()
+        get_item_tags(search_index if opts.search else None)
+
+        if opts.changes_file:
+            item_changes.compare(todo_files)
+
+        if split:
+            out_file_name = get_output_filename(opts.output_file, None, ".html")
+            pages = split_pages(out_file_name, opts.split_files)
 
-    if not opts.no_html:
-        write_html_output(opts)
+        fragment_cache.start(todo_files)
+
+    if split:
+        write_split_html_output(opts, pages)
+    elif not opts.no_html:
+        write_html_output(opts, spool)
 
     if opts.do_text or opts.do_text_dt:
-        write_text_output(opts)
+        write_text_output(opts, spool)
+
+    if unchanged_outputs:
+        print("\nReport unchanged: {0}".format(", ".join(unchanged_outputs)))
+
+    if opts.changes_file and spool is None:
+        item_changes.save()
+
+    if opts.save_snapshot and spool is None:
+        snapshot.save(opts.save_snapshot)
+
+    if opts.db_file and spool is None:
+        if result_store.con is None:
+            result_store.open(opts.db_file)
+        result_store.save(todo_files)
+
+
+def load_caches(opts: AppOptions):
+    if opts.cache_dir:
+        dir_cache.load(
+            str(Path(opts.cache_dir) / "dir-cache.json"),
+            file_specs,
+            opts.rebuild_cache,
+        )
+        #  The parse and fragment caches hold the items of every file, which
+        #  --spool is meant to avoid.
+        if not opts.spool:
+            parse_cache.load(
+                str(Path(opts.cache_dir) / "parse-cache.json"), opts.rebuild_cache
+            )
+            fragment_cache.load(
+                str(Path(opts.cache_dir) / "fragment-cache.json"), opts.rebuild_cache
+            )
+    elif opts.watch:
+        fragment_cache.enabled = True
+
+    if opts.changes_file:
+        item_changes.load(opts.changes_file)
+
+
+def print_summary(opts: AppOptions):
+    if opts.from_snapshot:
+        print(snapshot.summary())
+    else:
+        print(
+            "Skipped {0} of {1} files with no to-do markers.".format(
+                files_skipped, len(file_list)
+            )
+        )
+
+    if dir_cache.file_name:
+        print(dir_cache.summary())
+
+    if parse_cache.file_name:
+        print(parse_cache.summary())
+        print(fragment_cache.summary())
+
+    if opts.db_file:
+        print(result_store.summary())
+
+    if opts.changes_file:
+        print(item_changes.summary())
+
+
+def main(arglist=None):
+    if arglist is None:
+        arglist = sys.argv[1:]
+
+    if arglist and arglist[0] == "--query":
+        return query_main(arglist[1:])
+
+    print("Running {0}.".format(app_title))
+
+    opts = get_options(arglist)
+
+    assert opts.output_file is not None  # noqa: S101
+
+    global compact_html, use_ignore_files  # noqa: PLW0603
+    compact_html = opts.compact
+    use_ignore_files = not opts.no_ignore_files
+
+    if debug_stop_after_args:
+        raise SystemExit("STOPPED")
+
+    load_caches(opts)
+
+    spool = None
+    if opts.from_snapshot:
+        snapshot.load(opts.from_snapshot)
+        sort_todo_files(opts.by_mtime)
+    elif opts.spool:
+        scan_folders(opts)
+        sort_file_list(opts.by_mtime)
+        dir_cache.save(file_specs)
+        spool = ReportSpool(opts.do_text or opts.do_text_dt)
+        spool_todo_files(spool)
+    elif opts.pipeline_workers > 0:
+        scan_and_read_pipelined(opts)
+        dir_cache.save(file_specs)
+    else:
+        scan_folders(opts)
+        sort_file_list(opts.by_mtime)
+        dir_cache.save(file_specs)
+        read_todo_files(opts.parse_workers)
+
+    parse_cache.save()
+
+    try:
+        write_outputs(opts, spool)
+    finally:
+        if spool is not None:
+            spool.close()
+
+    fragment_cache.save()
 
     if error_messages:
         print("\nThere were errors!")
@@ -1012,6 +4847,13 @@ def main(arglist=None):
 
     open_html_output(opts)
 
+    print_summary(opts)
+
+    if opts.watch:
+        watch(opts)
+
+    result_store.close()
+
     print("Done ({0}).".format(app_title))
 
     return 0
@@ -7,9 +7,19 @@ tests rather than unit tests.
 
 """
 
+import json
+import os
+import pickle
+import re
+import sqlite3
+import sys
 import textwrap
+import threading
+import time
+from datetime import datetime
 from importlib import reload
-from pathlib import Path
+from itertools import accumulate
+from pathlib import Path, PurePosixPath
 
 import html5lib
 import pytest
@@ -352,6 +362,92 @@ def test_no_recurse(todo_files_dir):
     assert len(todolister.file_list) == n_files_not_in_subdir
 
 
+def test_scan_workers_same_as_serial(todo_files_dir):
+    d = todo_files_dir
+    args = [
+        str(d),
+        str(d / "SubDir"),
+        "--recurse",
+        "-x",
+        str(d / "NotThisDir"),
+        "--no-browser",
+        "--no-html",
+    ]
+
+    reload(todolister)
+    assert todolister.main(args) == 0
+    serial_files = list(todolister.file_list)
+    serial_errors = list(todolister.error_messages)
+
+    reload(todolister)
+    assert todolister.main([*args, "--scan-workers", "4"]) == 0
+
+    assert todolister.file_list == serial_files
+    assert todolister.error_messages == serial_errors
+
+
+def test_parse_workers_same_as_serial(todo_files_dir):
+    args = [str(todo_files_dir), "--recurse", "--no-browser", "--no-html"]
+
+    reload(todolister)
+    assert todolister.main(args) == 0
+    serial_files = list(todolister.todo_files)
+    serial_html = todolister.get_html_output("TEST", False)
+
+    reload(todolister)
+    assert todolister.main([*args, "--parse-workers", "2"]) == 0
+    assert todolister.todo_files == serial_files
+    #  Same flagged and tagged sections, ignoring the footer time.
+    html = todolister.get_html_output("TEST", False)
+    assert (
+        html.split('<div id="footer">')[0] == serial_html.split('<div id="footer">')[0]
+    )
+
+
+@pytest.mark.parametrize("by_mtime", [[], ["--mtime-desc"]])
+def test_pipeline_same_as_phased(todo_files_dir, by_mtime):
+    args = [str(todo_files_dir), "--recurse", "--no-browser", "--no-html", *by_mtime]
+
+    reload(todolister)
+    assert todolister.main(args) == 0
+    phased_files = list(todolister.todo_files)
+    phased_file_list = list(todolister.file_list)
+
+    reload(todolister)
+    assert todolister.main([*args, "--pipeline", "3"]) == 0
+    assert todolister.todo_files == phased_files
+    assert todolister.file_list == phased_file_list
+
+
+def test_pipeline_reads_while_scan_workers_list(tmp_path, monkeypatch):
+    (tmp_path / "notes.txt").write_text("[ ] At the top.\n")
+    (tmp_path / "later").mkdir()
+    (tmp_path / "later" / "notes.txt").write_text("[ ] Further down.\n")
+
+    reload(todolister)
+    first_read = threading.Event()
+    read_todo_items = todolister.read_todo_items
+    scan_dir = todolister.scan_dir
+
+    def reading(file_name):
+        first_read.set()
+        return read_todo_items(file_name)
+
+    def scanning(dir_name):
+        #  The sub-folder is only listed once a file has been read.
+        if dir_name.endswith("later"):
+            first_read.wait(5)
+        return scan_dir(dir_name)
+
+    monkeypatch.setattr(todolister, "read_todo_items", reading)
+    monkeypatch.setattr(todolister, "scan_dir", scanning)
+    args = [str(tmp_path), "-r", "-q", "-n", "--scan-workers", "2", "--pipeline", "2"]
+    started = time.monotonic()
+    assert todolister.main(args) == 0
+    assert time.monotonic() - started < 4
+    assert len(todolister.todo_files) == 2
+
+
 def test_html_output_is_parsable(todo_files_dir):
     reload(todolister)
     assert len(todolister.file_list) == 0
@@ -727,6 +823,10 @@ def test_bad_match_spec(tmp_path, capsys):
 
     captured = capsys.readouterr()
     assert "ERROR bad match spec '*.md$'" in captured.out
+    #  The bad spec is reported once, when the specs are compiled, rather
+    #  than for every file checked.
+    scan_out = captured.out.split("There were errors!")[0]
+    assert scan_out.count("ERROR bad match spec") == 1
 
     assert output_html.exists()
     text = output_html.read_text()
@@ -944,3 +1044,1062 @@ def test_ignore_block(tmp_path):
     assert "Ignore Partial_Path" not in htm
     assert "Ignore notes-private" not in htm
     assert "Ignore bad_notes.txt" not in htm
+
+
+def test_deep_tree_does_not_hit_recursion_limit(tmp_path):
+    reload(todolister)
+    assert len(todolister.file_list) == 0
+
+    #  Nest directories deeper than the recursion limit.
+    depth = sys.getrecursionlimit() + 50
+    d = tmp_path / "deep"
+    d.mkdir()
+    top = d
+    for _ in range(depth):
+        d = d / "d"
+        d.mkdir()
+    (d / "notes.txt").write_text("[ ] At the bottom.\n")
+
+    try:
+        todolister.file_specs.extend(todolister.default_file_specs)
+        todolister.get_matching_files(str(top), True)
+
+        assert len(todolister.file_list) == 1
+        assert todolister.file_list[0].full_name == str(d / "notes.txt")
+        assert not todolister.error_messages
+
+    finally:
+        #  Remove the tree bottom-up, as pytest's recursive cleanup would also
+        #  hit the recursion limit.
+        (d / "notes.txt").unlink()
+        while d != top:
+            d.rmdir()
+            d = d.parent
+
+
+def test_ignored_dirs_are_not_listed(tmp_path):
+    reload(todolister)
+
+    for sub in ["Keep", "Rubbish/Deeper", "Partial_Path/Deeper", "Excluded"]:
+        d = tmp_path / sub
+        d.mkdir(parents=True)
+        (d / "notes.txt").write_text("[ ] In {0}.\n".format(sub))
+
+    todolister.file_specs.extend(todolister.default_file_specs)
+    todolister.dirs_to_exclude.append(str(tmp_path / "Excluded"))
+    todolister.ignore_list.extend(["Rubbish/", "Partial_*/**"])
+
+    listed = []
+
+    def recording_scan(dir_name):
+        listed.append(dir_name)
+        return todolister.scan_dir(dir_name)
+
+    files = list(todolister.walk_matching_files(str(tmp_path), True, recording_scan))
+
+    assert [f.full_name for f in files] == [str(tmp_path / "Keep" / "notes.txt")]
+    assert sorted(listed) == [str(tmp_path), str(tmp_path / "Keep")]
+
+
+@pytest.mark.parametrize(
+    "pattern", ["[!a]*.txt", "[!]a]x", "[^a]*", "*/[!b]/n.txt", "[!a-c]otes.txt"]
+)
+def test_glob_class_same_as_path_match(pattern):
+    regex = re.compile(todolister.glob_match_regex(pattern))
+    for path in [
+        "/x/anotes.txt",
+        "/x/bnotes.txt",
+        "/x/]x",
+        "/x/bx",
+        "/^a",
+        "/b",
+        "/a/b/n.txt",
+        "/a/c/n.txt",
+        "/q/dotes.txt",
+    ]:
+        assert bool(regex.search(path)) == PurePosixPath(path).match(pattern), path
+
+    #  A negated class in an ignore file does not match across a '/'.
+    regex = re.compile(todolister.ignore_file_regex("a[!b]c", anchored=True))
+    assert regex.search("axc")
+    assert not regex.search("a/c")
+
+
+def test_parse_cache(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_notes_txt(data_dir)
+    write_todo_txt(data_dir)
+    cache_dir = tmp_path / "cache"
+
+    args = [
+        str(data_dir),
+        "--no-browser",
+        "-o",
+        str(tmp_path / "out.html"),
+        "--cache-dir",
+        str(cache_dir),
+    ]
+
+    reload(todolister)
+    assert todolister.main(args) == 0
+    assert todolister.parse_cache.misses == 2
+    assert todolister.parse_cache.hits == 0
+    assert (cache_dir / "parse-cache.json").exists()
+    html1 = todolister.get_html_output("TEST", False)
+
+    #  Unchanged files are served from the cache.
+    reload(todolister)
+    assert todolister.main(args) == 0
+    assert todolister.parse_cache.misses == 0
+    assert todolister.parse_cache.hits == 2
+    assert todolister.get_html_output("TEST", False) == html1
+
+    #  A changed file is read again, and a deleted file is evicted.
+    (data_dir / "notes.txt").write_text("[ ] Changed.\n[ ] And longer.\n")
+    (data_dir / "todo.txt").unlink()
+    reload(todolister)
+    assert todolister.main(args) == 0
+    assert todolister.parse_cache.misses == 1
+    assert todolister.parse_cache.evicted == 1
+    assert "Changed." in todolister.get_html_output("TEST", False)
+
+    #  Rebuilding ignores the cached items.
+    reload(todolister)
+    assert todolister.main([*args, "--rebuild-cache"]) == 0
+    assert todolister.parse_cache.hits == 0
+    assert todolister.parse_cache.misses == 1
+
+    #  The cache is not used at all with --no-cache.
+    reload(todolister)
+    assert todolister.main([*args, "--no-cache"]) == 0
+    assert todolister.parse_cache.file_name is None
+
+
+def test_dir_cache(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_notes_txt(data_dir)
+    write_subdir_notes_txt(data_dir)
+    (data_dir / "SubDir" / "other.md").write_text("[ ] Markdown.\n")
+    #  Directories modified in the last couple of seconds are not cached.
+    old = time.time() - 60
+    for d in [data_dir, data_dir / "SubDir"]:
+        os.utime(d, (old, old))
+
+    args = [
+        str(data_dir),
+        "--recurse",
+        "--no-browser",
+        "--no-html",
+        "--cache-dir",
+        str(tmp_path / "cache"),
+    ]
+
+    reload(todolister)
+    assert todolister.main(args) == 0
+    assert todolister.dir_cache.misses == 2
+    files1 = list(todolister.file_list)
+
+    reload(todolister)
+    assert todolister.main(args) == 0
+    assert todolister.dir_cache.hits == 2
+    assert todolister.dir_cache.misses == 0
+    assert todolister.file_list == files1
+
+    #  Changing a file does not change its directory, but the file is still
+    #  stat'ed for its size and modified time.
+    (data_dir / "notes.txt").write_text("[ ] Changed.\n")
+    os.utime(data_dir, (old, old))
+    reload(todolister)
+    assert todolister.main(args) == 0
+    assert todolister.dir_cache.hits == 2
+    assert "Changed." in todolister.get_text_output()
+
+    #  The cached listings are not used when the file specs change.
+    reload(todolister)
+    assert todolister.main([*args, "--add-match", "*.md"]) == 0
+    assert todolister.dir_cache.hits == 0
+    assert "Markdown." in todolister.get_text_output()
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watch_refresh(tmp_path, capsys, use_inotify):
+    reload(todolister)
+
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_notes_txt(data_dir)
+    write_todo_lc_txt(data_dir)
+    excl_dir = data_dir / "Excluded"
+    excl_dir.mkdir()
+    output_txt = tmp_path / "out.txt"
+
+    opts = todolister.get_options(
+        [
+            str(data_dir),
+            "--recurse",
+            "-x",
+            str(excl_dir),
+            "--no-browser",
+            "--no-html",
+            "-t",
+            "-o",
+            str(output_txt),
+        ]
+    )
+    todolister.scan_folders(opts)
+    todolister.sort_file_list(opts.by_mtime)
+    todolister.read_todo_files()
+    todolister.write_outputs(opts)
+
+    known_files = {f.full_name: f for f in todolister.file_list}
+    known_items = {t.full_name: t.todo_items for t in todolister.todo_files}
+
+    if use_inotify:
+        try:
+            watcher = todolister.InotifyWatcher()
+        except OSError:
+            pytest.skip("inotify is not available")
+        for scan_prop in todolister.dirs_to_scan:
+            watcher.add_tree(scan_prop.dir_name, scan_prop.do_recurse)
+        #  Excluded directories are not watched.
+        assert str(excl_dir) not in watcher.watches.values()
+        assert str(data_dir) in watcher.watches.values()
+    else:
+        watcher = todolister.PollingWatcher(0.01, known_files)
+
+    capsys.readouterr()
+
+    new_dir = data_dir / "NewDir"
+    new_dir.mkdir()
+    (new_dir / "notes.txt").write_text("[ ] In a new folder.\n")
+    (excl_dir / "notes.txt").write_text("[ ] Excluded.\n")
+    (data_dir / "notes.txt").write_text("[ ] Changed notes.\n")
+    (data_dir / "todo-lc.txt").unlink()
+
+    changes = set()
+    while True:
+        more = watcher.read_changes(0.2)
+        if not more:
+            break
+        changes |= more
+    watcher.close()
+
+    todolister.refresh_watched_paths(changes, known_files, known_items)
+    todolister.rebuild_outputs(opts, known_files, known_items)
+
+    captured = capsys.readouterr()
+    assert "Reading file [{0}]".format(data_dir / "notes.txt") in captured.out
+    assert "Reading file [{0}]".format(new_dir / "notes.txt") in captured.out
+    assert captured.out.count("Reading file") == 2
+
+    text = output_txt.read_text()
+    assert "Changed notes." in text
+    assert "In a new folder." in text
+    assert "todo-lc.txt" not in text
+    assert "Excluded." not in text
+
+
+def test_watch_skips_own_outputs(tmp_path, monkeypatch, capsys):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_notes_txt(data_dir)
+    out_html = data_dir / "out.html"
+    args = [str(data_dir), "--no-browser", "-t", "-o", str(out_html)]
+    args += ["--skip-unchanged", "--changes", str(data_dir / "changes.json")]
+
+    #  The events from writing the outputs into the watched folder.
+    reload(todolister)
+    opts = todolister.get_options(args)
+    todolister.load_caches(opts)
+    todolister.scan_folders(opts)
+    todolister.read_todo_files()
+    try:
+        watcher = todolister.InotifyWatcher()
+    except OSError:
+        watcher = None
+    if watcher is not None:
+        watcher.add_tree(str(data_dir), False)
+        todolister.write_outputs(opts)
+        own_changes = watcher.read_changes(1)
+        watcher.close()
+        assert own_changes
+        is_own_file = todolister.own_file_matcher(opts)
+        assert all(is_own_file(path) for path in own_changes)
+        assert not is_own_file(str(data_dir / "notes.txt"))
+
+    notes = data_dir / "notes.txt"
+    events = [
+        {
+            str(out_html),
+            str(out_html) + ".tmp",
+            str(data_dir / ".out.html.fingerprint"),
+            str(data_dir / "out.txt"),
+            str(data_dir / "changes.json.tmp"),
+            str(data_dir / "other.dat"),
+        },
+        set(),
+        {str(notes)},
+        set(),
+        {str(notes)},
+        set(),
+    ]
+
+    class ScriptedWatcher:
+        settled = False
+
+        def read_changes(self, timeout):  # noqa: ARG002
+            if not events:
+                raise KeyboardInterrupt
+            if len(events) == 4:
+                notes.write_text("[ ] Changed.\n")
+            return events.pop(0)
+
+        def close(self):
+            pass
+
+    rebuilds = []
+    reload(todolister)
+    monkeypatch.setattr(todolister, "make_watcher", lambda *_: ScriptedWatcher())
+    monkeypatch.setattr(todolister, "rebuild_outputs", lambda *a: rebuilds.append(a))
+    assert todolister.main([*args, "--watch"]) == 0
+    #  Only the changed file causes a rebuild; the outputs, a file that does
+    #  not match, and an event for a file that has not changed do not.
+    assert len(rebuilds) == 1
+
+
+def test_watch_polling_does_not_debounce(tmp_path, monkeypatch):
+    write_notes_txt(tmp_path)
+    args = [str(tmp_path), "--no-browser", "--no-html", "-q"]
+    args += ["--watch", "--poll-interval", "0.01"]
+
+    timeouts = []
+    read_changes = todolister.PollingWatcher.read_changes
+
+    def counted_read_changes(self, timeout):
+        if len(timeouts) == 3:
+            raise KeyboardInterrupt
+        timeouts.append(timeout)
+        return read_changes(self, timeout)
+
+    reload(todolister)
+    monkeypatch.setattr(todolister.PollingWatcher, "read_changes", counted_read_changes)
+    assert todolister.main(args) == 0
+    #  Each poll is a full scan, so there is no extra scan to let changes settle.
+    assert timeouts == [None, None, None]
+
+
+def test_ignore_files_and_prune(tmp_path):
+    root = tmp_path / "root"
+    for sub in [
+        "Generated",
+        "Anchored",
+        "sub/Generated",
+        "sub/Anchored",
+        "node_modules",
+    ]:
+        (root / sub).mkdir(parents=True)
+        (root / sub / "notes.txt").write_text("[ ] In {0}.\n".format(sub))
+    (root / ".gitignore").write_text(
+        textwrap.dedent(
+            """
+            # Comment line.
+            Generated/
+            /Anchored/
+            notes-*.bak.txt
+            !notes-keep.bak.txt
+            """
+        )
+    )
+    (root / "notes-old.bak.txt").write_text("[ ] Old backup.\n")
+    (root / "notes-keep.bak.txt").write_text("[ ] Kept backup.\n")
+    (root / "sub" / ".todolisterignore").write_text("notes-sub.txt\n")
+    (root / "sub" / "notes-sub.txt").write_text("[ ] Ignored in sub.\n")
+    (root / "notes-sub.txt").write_text("[ ] Not ignored above sub.\n")
+
+    reload(todolister)
+    todolister.file_specs.extend(todolister.default_file_specs)
+    todolister.prune_list.extend(todolister.default_prune_dirs)
+
+    listed = []
+
+    def recording_scan(dir_name):
+        listed.append(dir_name)
+        return todolister.scan_dir(dir_name)
+
+    files = list(todolister.walk_matching_files(str(root), True, recording_scan))
+    names = sorted(str(Path(f.full_name).relative_to(root)) for f in files)
+    assert names == [
+        "notes-keep.bak.txt",
+        "notes-sub.txt",
+        str(Path("sub/Anchored/notes.txt")),
+    ]
+    #  Ignored and pruned folders are not listed.
+    assert sorted(listed) == [str(root), str(root / "sub"), str(root / "sub/Anchored")]
+
+    #  The defaults can be turned off.
+    reload(todolister)
+    args = [str(root), "-r", "-q", "-n", "--no-prune", "--no-ignore-files"]
+    assert todolister.main(args) == 0
+    assert len(todolister.file_list) == 9
+
+    #  Parallel scanning applies the same rules.
+    reload(todolister)
+    assert todolister.main([str(root), "-r", "-q", "-n"]) == 0
+    serial_files = list(todolister.file_list)
+    assert len(serial_files) == 3
+    reload(todolister)
+    assert todolister.main([str(root), "-r", "-q", "-n", "--scan-workers", "3"]) == 0
+    assert todolister.file_list == serial_files
+
+    #  A folder cache written without the ignore files is still right for a
+    #  later run that uses them, in the same process.
+    #  Folders modified just now are not cached, so make them older.
+    for d in [root, *(p for p in root.rglob("*") if p.is_dir())]:
+        os.utime(d, ns=(d.stat().st_atime_ns, d.stat().st_mtime_ns - 10**10))
+    reload(todolister)
+    cache_args = [str(root), "-r", "-q", "-n", "--cache-dir", str(tmp_path / "c")]
+    assert todolister.main([*cache_args, "--no-ignore-files"]) == 0
+    assert len(todolister.file_list) == 8
+    todolister.file_list.clear()
+    todolister.dirs_to_scan.clear()
+    assert todolister.main(cache_args) == 0
+    assert todolister.dir_cache.hits > 0
+    assert todolister.file_list == serial_files
+
+
+def test_ignore_file_matching_a_spec(tmp_path):
+    root = tmp_path / "gi"
+    (root / "secret").mkdir(parents=True)
+    (root / ".gitignore").write_text("secret/\n")
+    (root / "secret" / "notes.txt").write_text("[ ] hidden\n")
+    (root / "notes.txt").write_text("[ ] shown\n")
+
+    for extra in [[], ["--scan-workers", "2"]]:
+        reload(todolister)
+        args = [str(root), "-r", "-q", "-n", "--add-match", "*", *extra]
+        assert todolister.main(args) == 0
+        names = sorted(Path(f.full_name).name for f in todolister.file_list)
+        assert names == [".gitignore", "notes.txt"]
+
+
+def test_parse_todo_lines_long_item(tmp_path):
+    n_lines = 20000
+    p = tmp_path / "notes.txt"
+    with p.open("w") as f:
+        f.write("Before.\n\n[ ]* A long item.\n")
+        for i in range(n_lines):
+            f.write("    line {0}\n".format(i))
+        f.write("\n[ ] Last item, no newline at the end of the file.")
+
+    items = todolister.get_todo_items(str(p))
+
+    assert len(items) == 2
+    assert items[0].is_flagged
+    assert items[0].item_text.count("\n") == n_lines + 1
+    assert items[0].item_text.endswith("    line {0}\n".format(n_lines - 1))
+    assert not items[1].is_flagged
+    assert items[1].item_text == "[ ] Last item, no newline at the end of the file."
+
+
+def test_files_without_markers_are_skipped(tmp_path, capsys):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "notes-empty.txt").write_text("")
+    (data_dir / "notes-plain.txt").write_text("Nothing to do here.\n" * 100)
+    (data_dir / "notes-inline.txt").write_text("Text with [ ] in a line.\n")
+    (data_dir / "notes-todo.txt").write_text(
+        "Intro with [ ] inline.\n\n  - [ ] Item one.\n\n [ ]* Item two.\n"
+    )
+
+    reload(todolister)
+    assert todolister.main([str(data_dir), "--no-browser", "--no-html"]) == 0
+    assert "Skipped 3 of 4 files with no to-do markers." in capsys.readouterr().out
+
+    #  Files found in the parse cache are counted the same.
+    cache_args = [str(data_dir), "--no-browser", "--no-html"]
+    cache_args += ["--cache-dir", str(tmp_path / "cache")]
+    for _ in range(2):
+        reload(todolister)
+        assert todolister.main(cache_args) == 0
+        out = capsys.readouterr().out
+        assert "Skipped 3 of 4 files with no to-do markers." in out
+    assert "Parse cache: 4 hits" in out
+
+    items = todolister.get_todo_items(str(data_dir / "notes-todo.txt"))
+    assert [i.item_text for i in items] == ["  - [ ] Item one.\n", " [ ]* Item two.\n"]
+    assert items[1].is_flagged
+    assert todolister.get_todo_items(str(data_dir / "notes-plain.txt")) == []
+
+
+def test_marker_scan_chunks(tmp_path, monkeypatch):
+    texts = [
+        "",
+        "No items.\n",
+        "x" * 50 + "\n  [ ] Item after a line.\n",
+        "Text [ ] inline.\r\n\r\n - [ ] Item with CRLF.\r\n",
+        "A long line " + "with words " * 20 + "[ ] inline.\n[ ] Item.\n",
+        "\u00a0[ ] Item after a non-ASCII space.\n",
+    ]
+    for n, text in enumerate(texts):
+        p = tmp_path / "notes-{0}.txt".format(n)
+        p.write_bytes(text.encode("utf-8"))
+        reload(todolister)
+        items, _ = todolister.read_todo_items(str(p))
+        expected = list(items or [])
+        #  With small chunks, a long line is parsed rather than skipped, so
+        #  the same items are found.
+        for size in [1, 2, 3, 5, 16]:
+            monkeypatch.setattr(todolister, "marker_scan_chunk_size", size)
+            items, _ = todolister.read_todo_items(str(p))
+            assert list(items or []) == expected
+    assert len(expected) == 1
+
+
+def test_item_tags_from_parsing():
+    lines = [
+        "[ ] Tags: #one, (#two) #three.\n",
+        "  #one\tagain, #a#b # not-a-tag a#b\n",
+        "\n",
+        "[ ] No tags here.\n",
+    ]
+    reload(todolister)
+    items = todolister.parse_todo_lines(lines, "notes.txt")
+    assert items[0].tags == ("#one", "#two", "#three", "#one", "#a#b")
+    assert items[1].tags == ()
+
+    todolister.todo_files.append(todolister.TodoFile("", "notes.txt", items))
+    todolister.get_item_tags()
+    assert list(todolister.item_tags) == ["#one", "#two", "#three", "#a#b"]
+    assert todolister.item_tags["#one"] == [items[0], items[0]]
+
+
+def test_item_tags_same_as_split():
+    def split_tags(text):
+        #  How tags were found before: separators made into spaces, then the
+        #  text stripped and split on spaces.
+        for c in "\t\n,.()":
+            text = text.replace(c, " ")
+        return [w for w in text.strip().split(" ") if len(w) > 1 and w[0] == "#"]
+
+    for text in [
+        "[ ] Pay rent #home\xa0\n",
+        "[ ] Pay rent #home\x0c\n",
+        "[ ] Pay rent #home\xa0.\u2028\n",
+        "\xa0#start, #mid\xa0dle #mid\x0c more (#end)\r\n",
+        "[ ] #a #\t# b #c#d.\n",
+    ]:
+        items = todolister.FileItems("notes.txt", b"\0", [text])
+        assert list(items.tags.get(0, ())) == split_tags(text), repr(text)
+
+
+def test_file_items_view():
+    lines = ["[ ]* One #a.\n", "\n", "[ ]+ Two.\n", "  more\n", "\n", "- [ ] Three\n"]
+    reload(todolister)
+    items = todolister.parse_todo_lines(lines, "".join(["notes", ".txt"]))
+    expected = [
+        todolister.TodoItem(True, False, "[ ]* One #a.\n", "notes.txt", ("#a",)),
+        todolister.TodoItem(False, True, "[ ]+ Two.\n  more\n", "notes.txt"),
+        todolister.TodoItem(False, False, "- [ ] Three\n", "notes.txt"),
+    ]
+    assert items == expected
+    assert list(items) == expected
+    assert items[-1] == expected[-1]
+    assert items[1:] == expected[1:]
+    assert len(items) == 3
+    assert items.file_name is sys.intern("notes.txt")
+    assert pickle.loads(pickle.dumps(items)) == items  # noqa: S301
+
+    refs = todolister.ItemRefs()
+    refs.append(items, 2)
+    refs.append(items, 0)
+    assert refs == [expected[2], expected[0]]
+
+
+def test_written_output_same_as_joined(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_notes_txt(data_dir)
+    write_todo_txt(data_dir)
+    out_html = tmp_path / "out.html"
+
+    reload(todolister)
+    args = [str(data_dir), "--no-browser", "-o", str(out_html), "-t"]
+    args += ["--page-title", "TEST"]
+    assert todolister.main(args) == 0
+
+    assert out_html.read_text() == todolister.get_html_output("TEST", False)
+    assert out_html.with_suffix(".txt").read_text() == todolister.get_text_output()
+    assert len(list(todolister.html_output_parts("TEST", False))) > 10
+
+
+def test_spool_same_as_in_memory(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_notes_txt(data_dir)
+    write_todo_txt(data_dir)
+    (data_dir / "notes-tags.txt").write_text(
+        "[ ]* Flagged #one #two.\n\n[ ] Plain #two, with <markup> & ünïcode.\n"
+    )
+    (data_dir / "notes-none.txt").write_text("No items.\n")
+
+    def run(extra):
+        out_html = tmp_path / extra[0] / "out.html"
+        out_html.parent.mkdir()
+        reload(todolister)
+        todolister.run_dt = datetime(2025, 1, 2, 3, 4)
+        args = [str(data_dir), "--no-browser", "-t", "-o", str(out_html), *extra[1:]]
+        assert todolister.main(args) == 0
+        return out_html.read_text(), out_html.with_suffix(".txt").read_text()
+
+    html, text = run(["memory"])
+    spool_html, spool_text = run(["spool", "--spool"])
+    assert todolister.todo_files == []
+    assert spool_html == html
+    assert spool_text == text
+    assert "Flagged #one" in html
+    assert "#two" in html
+
+    #  Only the folder listings are cached, so the items of every file are
+    #  not held in memory.
+    cache_dir = tmp_path / "cache"
+    cached_html, _ = run(["cached", "--spool", "--cache-dir", str(cache_dir)])
+    assert cached_html == html
+    assert todolister.parse_cache.entries == {}
+    assert (cache_dir / "dir-cache.json").exists()
+    assert not (cache_dir / "parse-cache.json").exists()
+    assert not (cache_dir / "fragment-cache.json").exists()
+
+
+def test_fragment_cache(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_notes_txt(data_dir)
+    write_todo_txt(data_dir)
+    (data_dir / "notes-tags.txt").write_text("[ ]* Flagged #one.\n\n[ ] Also #one.\n")
+    cache_dir = tmp_path / "cache"
+    args = [str(data_dir), "--no-browser", "--no-html", "--cache-dir", str(cache_dir)]
+
+    def run(extra=()):
+        reload(todolister)
+        todolister.run_dt = datetime(2025, 1, 2, 3, 4)
+        assert todolister.main([*args, *extra]) == 0
+        return todolister.get_html_output("TEST", False)
+
+    html1 = run()
+    n_files = todolister.fragment_cache.misses
+    assert n_files > 0
+    assert (cache_dir / "fragment-cache.json").exists()
+
+    #  Cached fragments give the same page.
+    assert run() == html1
+    assert todolister.fragment_cache.hits == n_files
+    assert todolister.fragment_cache.misses == 0
+
+    #  Only the changed file is rendered again.
+    (data_dir / "notes-tags.txt").write_text("[ ]* Changed #one.\n")
+    html3 = run()
+    assert todolister.fragment_cache.misses == 1
+    assert "Changed #one." in html3
+    assert "Also #one." not in html3
+    assert run(["--no-cache"]) == html3
+
+
+def test_skip_unchanged(tmp_path, capsys):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_notes_txt(data_dir)
+    out_html = tmp_path / "out.html"
+    out_txt = tmp_path / "out.txt"
+    args = [str(data_dir), "-o", str(out_html), "-t", "--skip-unchanged"]
+
+    def run(minute):
+        reload(todolister)
+        todolister.run_dt = datetime(2025, 1, 2, 3, minute)
+        assert todolister.main([*args, "--no-browser"]) == 0
+        return capsys.readouterr().out
+
+    run(0)
+    assert (tmp_path / ".out.html.fingerprint").exists()
+    assert (tmp_path / ".out.txt.fingerprint").exists()
+    assert not (tmp_path / "out.html.tmp").exists()
+    mtimes = (out_html.stat().st_mtime_ns, out_txt.stat().st_mtime_ns)
+
+    #  Only the run time differs, so the files are not written again.
+    out = run(1)
+    assert "Report unchanged:" in out
+    assert (out_html.stat().st_mtime_ns, out_txt.stat().st_mtime_ns) == mtimes
+    assert "2025-01-02 03:00" in out_html.read_text()
+
+    #  A changed item is written.
+    (data_dir / "notes.txt").write_text("[ ] A new item.\n")
+    out = run(2)
+    assert "Report unchanged:" not in out
+    assert "A new item." in out_html.read_text()
+    assert "A new item." in out_txt.read_text()
+
+    #  A text output with the date and time in its name is compared with the
+    #  last one written.
+    args = [str(data_dir), "-o", str(out_html), "-n", "-d", "--skip-unchanged"]
+    (data_dir / "notes.txt").write_text("[ ] A dated item.\n")
+    run(3)
+    assert (tmp_path / "out_20250102_030300.txt").exists()
+    out = run(4)
+    assert "Report unchanged: {0}".format(tmp_path / "out_20250102_030300.txt") in out
+    assert not (tmp_path / "out_20250102_030400.txt").exists()
+    (data_dir / "notes.txt").write_text("[ ] Another item.\n")
+    run(5)
+    assert (tmp_path / "out_20250102_030500.txt").exists()
+
+
+def test_compact_html(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "notes.txt").write_text(
+        "[ ]* Flagged #one #two.\n    Second line.\n\n"
+        "[ ] Plain #two, with <markup> & " + "long " * 20 + "text.\n"
+    )
+
+    def run(extra):
+        out_html = tmp_path / extra[0] / "out.html"
+        out_html.parent.mkdir()
+        reload(todolister)
+        todolister.run_dt = datetime(2025, 1, 2, 3, 4)
+        args = [str(data_dir), "--no-browser", "-o", str(out_html), *extra[1:]]
+        assert todolister.main(args) == 0
+        return out_html.read_text()
+
+    html = run(["full"])
+    compact = run(["compact", "--compact"])
+    spool = run(["spool", "--compact", "--spool"])
+    minified = run(["minified", "--compact", "--minify"])
+
+    assert spool == compact
+    assert html.count("Second line.") == 4
+    assert compact.count("Second line.") == 1
+    assert compact.count("Flagged #one #two.") == 4
+    assert "Plain #two, with &lt;markup&gt; &amp; long long" in compact
+    assert "long text." not in compact.split('<div id="main">')[0]
+
+    #  Each link to an item refers to its anchor in the main section.
+    doc = html5lib.parse(compact, namespaceHTMLElements=False)
+    ids = {e.get("id") for e in doc.iter() if e.get("id")}
+    hrefs = {e.get("href")[1:] for e in doc.iter("a") if e.get("href")}
+    item_links = sorted(h for h in hrefs if ":" in h)
+    assert [h.rsplit("-", 1)[1] for h in item_links] == ["txt:1", "txt:2"]
+    assert hrefs <= ids
+
+    assert "\n" not in minified
+    assert "<!--end" not in minified
+    assert (
+        html5lib.parse(minified, namespaceHTMLElements=False).find(".//div[@id='main']")
+        is not None
+    )
+
+
+def test_split_output(tmp_path, capsys):
+    dir_a = tmp_path / "a"
+    dir_a.mkdir()
+    dir_b = tmp_path / "b"
+    dir_b.mkdir()
+    (dir_a / "notes.txt").write_text("[ ]* Item A1 #t\n\n[ ] Item A2\n")
+    (dir_b / "notes.txt").write_text("[ ] Item B1 #t\n")
+    (dir_b / "todo.txt").write_text("[ ] Item B2\n")
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    out_html = out_dir / "out.html"
+
+    def run(*extra):
+        reload(todolister)
+        args = [str(dir_a), str(dir_b), "--no-browser", "-o", str(out_html)]
+        assert todolister.main([*args, "--compact", *extra]) == 0
+        return capsys.readouterr().out
+
+    run("--split-output")
+    index = out_html.read_text()
+    page_a = (out_dir / "out-1.html").read_text()
+    page_b = (out_dir / "out-2.html").read_text()
+    assert "Item A1" in page_a
+    assert "Item A2" in page_a
+    assert "Item B1" not in page_a
+    assert "Item B1" in page_b
+    assert "Item B2" in page_b
+    assert '<div id="main">' not in index
+    assert 'href="out-1.html"' in index
+    assert 'href="out-2.html#' in index
+    assert 'href="out.html"' in page_a
+
+    #  Each link goes to an id on the page it names.
+    ids = {}
+    docs = {}
+    for f in out_dir.glob("*.html"):
+        docs[f.name] = html5lib.parse(f.read_text(), namespaceHTMLElements=False)
+        ids[f.name] = {e.get("id") for e in docs[f.name].iter() if e.get("id")}
+    for name, doc in docs.items():
+        for e in doc.iter("a"):
+            if e.get("href"):
+                page, _, anchor = e.get("href").partition("#")
+                assert not anchor or anchor in ids[page or name]
+
+    #  Only the page with a changed file is written.
+    (dir_b / "todo.txt").write_text("[ ] Item B2 changed\n")
+    out = run("--split-output")
+    assert "Output file [{0}] unchanged.".format(out_dir / "out-1.html") in out
+    assert "Wrote 1 of 2 pages." in out
+    assert "Item B2 changed" in (out_dir / "out-2.html").read_text()
+
+    #  Pages left from a run with more pages are removed.
+    run("--split-files", "1")
+    assert (out_dir / "out-3.html").exists()
+    run("--split-output")
+    assert not (out_dir / "out-3.html").exists()
+    assert not (out_dir / ".out-3.html.fingerprint").exists()
+
+
+def test_virtual_html(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_notes_txt(data_dir)
+    (data_dir / "notes-tags.txt").write_text(
+        "[ ]* Flagged #one #two.\n\n[ ] Plain #two, with </script> & <markup>.\n"
+    )
+    out_html = tmp_path / "out.html"
+
+    reload(todolister)
+    args = [str(data_dir), "--no-browser", "-o", str(out_html), "--virtual"]
+    assert todolister.main(args) == 0
+    html = out_html.read_text()
+
+    start = html.index('<script type="application/json" id="todo_data">')
+    data_json = html[start : html.index("</script>", start)].split(">", 1)[1]
+    assert "<" not in data_json
+    data = json.loads(data_json)
+
+    files = [f for f in todolister.todo_files if f.todo_items]
+    assert data["paths"] == [f.full_name for f in files]
+    assert data["counts"] == [len(f.todo_items) for f in files]
+    assert data["text"] == [i.item_text for f in files for i in f.todo_items]
+    assert [int(c) & todolister.item_flagged for c in data["flags"]] == [
+        int(i.is_flagged) for f in files for i in f.todo_items
+    ]
+    tags = dict(data["tags"])
+    assert sorted(tags) == ["#hashtag", "#one", "#two"]
+    assert [data["text"][i] for i in tags["#two"]] == [
+        "[ ]* Flagged #one #two.\n",
+        "[ ] Plain #two, with </script> & <markup>.\n",
+    ]
+
+    #  Each item is only in the data, and the page needs no other files.
+    assert html.count("Flagged #one") == 1
+    assert "#flagged_section, #tags_section" in html
+    assert " src=" not in html
+    assert html.count('<details class="tagrows">') == 3
+    doc = html5lib.parse(html, namespaceHTMLElements=False)
+    assert doc.find(".//div[@id='main_items']") is not None
+
+
+def test_search_index(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "notes-one.txt").write_text(
+        "[ ]* Fix the Build #One.\n\n[ ] Write notes, then fix.\n"
+    )
+    (data_dir / "notes-two.txt").write_text("[ ] Ünïcode İtem #one #Two\n")
+    out_html = tmp_path / "out.html"
+
+    reload(todolister)
+    args = [str(data_dir), "--no-browser", "-o", str(out_html), "--search"]
+    assert todolister.main(args) == 0
+    html = out_html.read_text()
+    assert '<input id="filter"' in html
+
+    start = html.index('<script type="application/json" id="todo_data">')
+    data_json = html[start : html.index("</script>", start)].split(">", 1)[1]
+    data = json.loads(data_json)
+    assert data["paths"][0].endswith("notes-one.txt")
+    search = data["search"]
+
+    def postings(terms, lists, term):
+        numbers = list(accumulate(lists[terms.index(term)]))
+        assert numbers == sorted(numbers)
+        return numbers
+
+    def items(term):
+        return postings(search["terms"], search["items"], term)
+
+    assert search["terms"] == sorted(search["terms"])
+    assert items("fix") == [0, 1]
+    assert items("build") == [0]
+    assert items("#one") == [0, 2]
+    assert items("#two") == [2]
+    assert items("ünïcode") == [2]
+    assert "the" in search["terms"]
+    assert postings(search["pathTerms"], search["files"], "notes") == [0, 1]
+    assert postings(search["pathTerms"], search["files"], "two") == [1]
+
+
+def test_result_store_query(tmp_path, capsys):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "notes-ops.txt").write_text(
+        "[ ]* Restart the #ops server.\n\n[ ] Rotate #ops logs.\n"
+    )
+    (data_dir / "notes-home.txt").write_text("[ ] Fix the server at home.\n")
+    db_file = str(tmp_path / "todo.db")
+    args = [str(data_dir), "--no-browser", "-o", str(tmp_path / "out.html")]
+
+    def scan():
+        reload(todolister)
+        assert todolister.main([*args, "--db", db_file]) == 0
+        return capsys.readouterr().out
+
+    def query(*query_args):
+        assert todolister.main(["--query", "--db", db_file, *query_args]) == 0
+        return capsys.readouterr().out
+
+    assert "Result store: 2 files updated, 0 removed." in scan()
+    assert "Result store: 0 files updated, 0 removed." in scan()
+
+    out = query("--tag", "ops")
+    assert "Restart the #ops server." in out
+    assert "Rotate #ops logs." in out
+    assert "2 items found." in out
+
+    out = query("server")
+    assert "notes-home.txt" in out
+    assert "2 items found." in out
+
+    out = query("serv*", "--flagged", "--path", "ops")
+    assert "Restart the #ops server." in out
+    assert "1 item found." in out
+
+    assert "0 items found." in query("--tag", "#ops", "--since", "2999-01-01")
+    assert "1 item found." in query("--days", "1", "--limit", "1")
+    for bad_args in [
+        ["--since", "garbage"],
+        ["--since", "2025-13-01"],
+        ["--days", "-1"],
+    ]:
+        with pytest.raises(SystemExit):
+            query(*bad_args)
+    capsys.readouterr()
+
+    (data_dir / "notes-home.txt").unlink()
+    (data_dir / "notes-ops.txt").write_text("[ ] Patch the #ops server.\n")
+    assert "Result store: 1 files updated, 1 removed." in scan()
+    out = query("server")
+    assert "Patch the #ops server." in out
+    assert "1 item found." in out
+
+    with pytest.raises(SystemExit):
+        query_args = ["--query", "--db", str(tmp_path / "missing.db")]
+        todolister.main(query_args)
+
+    #  A folder named "query" is scanned.
+    query_dir = tmp_path / "query"
+    query_dir.mkdir()
+    (query_dir / "notes.txt").write_text("[ ] In the query folder.\n")
+    reload(todolister)
+    assert todolister.main([str(query_dir), "--no-browser", *args[2:]]) == 0
+    assert len(todolister.todo_files) == 1
+
+
+def test_result_store_keeps_other_databases(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_notes_txt(data_dir)
+    args = [str(data_dir), "--no-browser", "-o", str(tmp_path / "out.html")]
+
+    #  The tables of a database written by another app are not dropped.
+    other_db = tmp_path / "other.db"
+    con = sqlite3.connect(other_db)
+    with con:
+        con.execute("CREATE TABLE files (name TEXT)")
+        con.execute("INSERT INTO files VALUES ('keep')")
+    con.close()
+    for other_file in [other_db, data_dir / "notes.txt"]:
+        reload(todolister)
+        with pytest.raises(SystemExit, match="not written by|Cannot use"):
+            todolister.main([*args, "--db", str(other_file)])
+    con = sqlite3.connect(other_db)
+    assert con.execute("SELECT name FROM files").fetchall() == [("keep",)]
+    con.close()
+
+
+def test_snapshot_same_as_scan(todo_files_dir, tmp_path):
+    snap_file = str(tmp_path / "todo.snap")
+    args = ["--no-browser", "--no-html"]
+
+    reload(todolister)
+    scan_args = [str(todo_files_dir), "--recurse", "--mtime-desc", *args]
+    assert todolister.main([*scan_args, "--save-snapshot", snap_file]) == 0
+    scanned_files = list(todolister.todo_files)
+    scanned_html = todolister.get_html_output("TEST", True)
+    scanned_dirs = list(todolister.dirs_to_scan)
+
+    reload(todolister)
+    assert todolister.main([*args, "--mtime-desc", "--from-snapshot", snap_file]) == 0
+    assert todolister.dirs_to_scan == scanned_dirs
+    assert todolister.file_list == []
+    items = todolister.todo_files[0].todo_items
+    assert isinstance(items, todolister.SnapshotItems)
+    assert items.loaded_text is None
+    assert todolister.todo_files == scanned_files
+    assert items.loaded_text is not None
+    html = todolister.get_html_output("TEST", True)
+    assert (
+        html.split('<div id="footer">')[0] == scanned_html.split('<div id="footer">')[0]
+    )
+
+    reload(todolister)
+    assert todolister.main([*args, "--from-snapshot", snap_file]) == 0
+    names = [f.full_name for f in todolister.todo_files]
+    assert names == sorted(names, key=str.lower)
+
+    with pytest.raises(SystemExit):
+        todolister.main([*args, "--from-snapshot", str(tmp_path / "missing.snap")])
+    with pytest.raises(SystemExit):
+        todolister.main([*args, "--from-snapshot", snap_file, "--watch"])
+
+
+def test_changes_since_last_run(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    file_a = data_dir / "notes-a.txt"
+    file_b = data_dir / "notes-b.txt"
+    file_a.write_text(
+        "[ ] Keep this.\n\n[ ]* Move   this.\n  more\n\n[ ] Close this.\n"
+    )
+    file_b.write_text("[ ] Keep this too.\n")
+    out_file = str(tmp_path / "out.html")
+    args = [str(data_dir), "--no-browser", "-o", out_file, "-t"]
+    args += ["--changes", str(tmp_path / "changes.json")]
+
+    reload(todolister)
+    assert todolister.main(args) == 0
+    assert 'id="changes_section"' not in Path(out_file).read_text()
+
+    file_a.write_text("[ ] Keep this.\n\n[ ] Add this.\n")
+    file_b.write_text("[ ] Keep this too.\n\n[ ]* Move this.\n    more\n")
+
+    reload(todolister)
+    assert todolister.main(args) == 0
+    changes = todolister.item_changes
+    assert [i.item_text.strip() for i in changes.added] == ["[ ] Add this."]
+    assert [i.source_file for i in changes.moved] == [str(file_b)]
+    assert changes.moved_from == [str(file_a)]
+    assert changes.closed == [(str(file_a), "[ ] Close this.")]
+
+    html = Path(out_file).read_text()
+    assert 'href="#changes_section"' in html
+    assert "New Items (1)" in html
+    assert "Moved from {0}".format(file_a) in html
+    assert "Closed Items (1)" in html
+    text = Path(out_file).with_suffix(".txt").read_text()
+    assert "1 new, 1 moved, 1 closed." in text
+    assert "(moved from {0})".format(file_a) in text
+
+    reload(todolister)
+    assert todolister.main(args) == 0
+    assert "No changes." in Path(out_file).read_text()